@@ -0,0 +1,230 @@
+"""
+Micro-batching of concurrent prediction requests: the records of the requests that arrive within a
+short time are predicted together with a single call to the model
+"""
+import asyncio
+import logging
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Raised by MicroBatcher.submit when too many requests are waiting and it should not wait
+    """
+
+
+class BatcherStoppedError(Exception):
+    """
+    Raised by MicroBatcher.submit when the batcher is stopped before predicting the request
+    """
+
+
+def _concatenate_lists(inputs):
+    return [record for records in inputs for record in records]
+
+
+class MicroBatcher:
+    """
+    Collect the requests submitted concurrently with submit and predict them in batches. A batch is
+    predicted when it has max_batch_size records, or max_wait seconds after its first request.
+    The prediction runs in a thread, so the event loop keeps accepting requests in the meantime.
+
+    At most max_queue_size requests wait for a batch: further requests are rejected or wait for
+    space (see submit), so a slow model applies backpressure to the clients instead of accumulating
+    latency. Larger max_batch_size and max_wait give more throughput, smaller give less latency
+
+    :param predict_batch: function input of a batch -> sequence of predictions (one per record)
+    :param max_batch_size: maximum number of records in a batch (a single request can be larger)
+    :param max_wait: maximum time (in seconds) a request waits for other requests to join its batch
+    :param max_queue_size: maximum number of requests waiting for a batch (0 for no limit)
+    :param concatenate: function list of request inputs -> input of the batch. By default the inputs
+                        are lists of records, concatenated into one list
+    """
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait=0.002, max_queue_size=0,
+                 concatenate=_concatenate_lists):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.concatenate = concatenate
+
+        self.n_rejected = 0
+
+        self._queue = None
+        self._worker = None
+        # Futures of the requests of the batch being collected or predicted
+        self._in_flight = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop predicting. The requests still waiting, and the ones being predicted, fail with
+        BatcherStoppedError
+        """
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("The batching worker failed")
+        self._worker = None
+
+        error = BatcherStoppedError("The batcher was stopped before predicting the request")
+        pending = self._in_flight
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[2])
+        self._in_flight = []
+
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def qsize(self):
+        """
+        Number of requests waiting for a batch
+        """
+        return self._queue.qsize()
+
+    async def submit(self, records, wait=False):
+        """
+        Predict the records (any input with a length, see concatenate) and return the list of their
+        predictions. If the prediction of the batch fails, the exception is raised here (and only
+        for the requests of that batch)
+
+        :param records: the records
+        :param wait: what to do if the queue is full: wait for space if True, otherwise raise
+                     QueueFullError
+        :raise BatcherStoppedError: if the batcher is not running, or is stopped before predicting
+                                    the records
+        """
+        if self._worker is None:
+            raise BatcherStoppedError("The batcher is not running")
+
+        # Raises TypeError here, for this request only, if records has no length
+        request = (records, len(records), asyncio.get_running_loop().create_future())
+
+        if wait:
+            await self._queue.put(request)
+            if self._worker is None:
+                # Stopped while waiting for space
+                raise BatcherStoppedError("The batcher was stopped before predicting the request")
+        else:
+            try:
+                self._queue.put_nowait(request)
+            except asyncio.QueueFull:
+                self.n_rejected += 1
+                raise QueueFullError(f"{self._queue.qsize()} requests are already waiting")
+
+        return await request[2]
+
+    async def _next_batch(self):
+        """
+        Wait for the requests of the next batch. They are added to _in_flight as they are taken
+        from the queue, so that stop can fail them
+        """
+        loop = asyncio.get_running_loop()
+
+        self._in_flight = []
+        requests = []
+
+        def take(request):
+            requests.append(request)
+            self._in_flight.append(request[2])
+            return request[1]
+
+        n_records = take(await self._queue.get())
+        deadline = loop.time() + self.max_wait
+
+        while n_records < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            n_records += take(request)
+
+        return requests
+
+    async def _predict(self, requests):
+        loop = asyncio.get_running_loop()
+
+        records = self.concatenate([records for records, _, _ in requests])
+        predictions = await loop.run_in_executor(None, self.predict_batch, records)
+
+        n_records = sum(n for _, n, _ in requests)
+        if len(predictions) != n_records:
+            raise ValueError(f"Got {len(predictions)} predictions for {n_records} records")
+
+        start = 0
+        for _, n, future in requests:
+            if not future.done():
+                future.set_result(list(predictions[start:start + n]))
+            start += n
+
+    async def _run(self):
+        while True:
+            requests = await self._next_batch()
+
+            # Any failure (for example inputs that cannot be concatenated) only fails this batch
+            try:
+                await self._predict(requests)
+            except Exception as e:
+                logger.exception("Prediction of a batch failed")
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+
+            self._in_flight = []
+
+
+class BatchedModel:
+    """
+    Batching around a loaded model (for example the pipeline of an MLflow model export), for
+    in-process use from asyncio code: concurrent calls to predict are run as one call to the predict
+    of the model
+
+    :param model: the model, with a predict method taking a DataFrame
+    :param kwargs: arguments for MicroBatcher (max_batch_size, max_wait, max_queue_size)
+    """
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.batcher = MicroBatcher(self._predict_batch, concatenate=self._concatenate, **kwargs)
+
+    @staticmethod
+    def _concatenate(inputs):
+        return pd.concat(inputs, ignore_index=True)
+
+    def _predict_batch(self, X):
+        return self.model.predict(X)
+
+    async def start(self):
+        await self.batcher.start()
+
+    async def stop(self):
+        await self.batcher.stop()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def predict(self, X, wait=True):
+        """
+        Predict the rows of the DataFrame X. By default, waits for space if the queue is full (see
+        MicroBatcher.submit)
+        """
+        return await self.batcher.submit(X, wait=wait)
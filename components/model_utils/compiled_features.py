@@ -0,0 +1,247 @@
+"""
+Compilation of a fitted preprocessing (ColumnTransformer) into a plain function from column arrays
+to the feature matrix, without DataFrames and without the input validation of scikit-learn. The
+fitted state is turned into lookup tables (encoders), a vocabulary and idf vector (TF-IDF) and
+constant fills (imputers), and the output is identical to the one of the ColumnTransformer.
+
+Custom transformers can be compiled by implementing compile_transform(), returning a function
+array -> array equivalent to their transform
+"""
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _missing_mask(X):
+    return np.array([_is_missing(value) for value in X.ravel()], dtype=bool).reshape(X.shape)
+
+
+def _compile_simple_imputer(imputer):
+    if imputer.add_indicator:
+        raise NotImplementedError("Cannot compile a SimpleImputer with add_indicator")
+
+    statistics = imputer.statistics_
+
+    if statistics.dtype.kind in "fiu":
+        def transform(X):
+            X = np.array(X, dtype=object)
+            X[_missing_mask(X)] = np.nan
+            X = X.astype(np.float64)
+            return np.where(np.isnan(X), statistics, X)
+    else:
+        def transform(X):
+            X = np.array(X, dtype=object)
+            mask = _missing_mask(X)
+            X[mask] = np.broadcast_to(statistics, X.shape)[mask]
+            return X
+
+    return transform
+
+
+def _compile_ordinal_encoder(encoder):
+    lookups = [
+        {c: float(i) for i, c in enumerate(categories) if not _is_missing(c)}
+        for categories in encoder.categories_
+    ]
+    use_unknown_value = encoder.handle_unknown == "use_encoded_value"
+    missing_value = getattr(encoder, "encoded_missing_value", np.nan)
+
+    def encode(value, lookup):
+        if _is_missing(value):
+            return missing_value
+        if value in lookup:
+            return lookup[value]
+        if use_unknown_value:
+            return encoder.unknown_value
+        raise ValueError(f"Found unknown category {value!r} during transform")
+
+    def transform(X):
+        X = np.asarray(X, dtype=object)
+        out = np.empty(X.shape, dtype=encoder.dtype)
+        for j, lookup in enumerate(lookups):
+            out[:, j] = [encode(value, lookup) for value in X[:, j]]
+        return out
+
+    return transform
+
+
+def _compile_one_hot_encoder(encoder):
+    if encoder.drop_idx_ is not None or getattr(encoder, "_infrequent_enabled", False):
+        raise NotImplementedError("Cannot compile a OneHotEncoder with drop or infrequent categories")
+
+    lookups = [{c: i for i, c in enumerate(categories)} for categories in encoder.categories_]
+    offsets = np.cumsum([0] + [len(categories) for categories in encoder.categories_])
+    ignore_unknown = encoder.handle_unknown != "error"
+
+    def transform(X):
+        X = np.asarray(X, dtype=object)
+        out = np.zeros((len(X), offsets[-1]), dtype=encoder.dtype)
+        for j, lookup in enumerate(lookups):
+            for i, value in enumerate(X[:, j]):
+                if value in lookup:
+                    out[i, offsets[j] + lookup[value]] = 1.0
+                elif not ignore_unknown:
+                    raise ValueError(f"Found unknown category {value!r} during transform")
+        return out
+
+    return transform
+
+
+def _compile_tfidf_vectorizer(vectorizer):
+    analyze = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    idf = vectorizer.idf_ if vectorizer.use_idf else None
+    n_features = len(vocabulary)
+
+    def transform_document(document, row):
+        counts = {}
+        for token in analyze(document):
+            j = vocabulary.get(token)
+            if j is not None:
+                counts[j] = counts.get(j, 0) + 1
+
+        # Same operations, in the same order (by feature index), as TfidfTransformer
+        indices = sorted(counts)
+        values = [1.0 if vectorizer.binary else float(counts[j]) for j in indices]
+        if vectorizer.sublinear_tf:
+            values = [float(np.log(v)) + 1 for v in values]
+        if idf is not None:
+            values = [v * idf[j] for v, j in zip(values, indices)]
+
+        if vectorizer.norm is not None:
+            norm = 0.0
+            for v in values:
+                norm += v * v if vectorizer.norm == "l2" else abs(v)
+            if vectorizer.norm == "l2":
+                norm = float(np.sqrt(norm))
+            if norm != 0.0:
+                values = [v / norm for v in values]
+
+        row[indices] = values
+
+    def transform(documents):
+        out = np.zeros((len(documents), n_features), dtype=np.float64)
+        for i, document in enumerate(documents):
+            transform_document(document, out[i])
+        return out
+
+    return transform
+
+
+def _compile_function_transformer(transformer):
+    if transformer.func is None:
+        return lambda X: X
+
+    func, kw_args = transformer.func, transformer.kw_args or {}
+    return lambda X: func(X, **kw_args)
+
+
+def _compile_pipeline(pipeline):
+    steps = [compile_transformer(step) for _, step in pipeline.steps if step not in (None, "passthrough")]
+
+    def transform(X):
+        for step in steps:
+            X = step(X)
+        return X
+
+    return transform
+
+
+_COMPILERS = [
+    (Pipeline, _compile_pipeline),
+    (SimpleImputer, _compile_simple_imputer),
+    (OrdinalEncoder, _compile_ordinal_encoder),
+    (OneHotEncoder, _compile_one_hot_encoder),
+    (TfidfVectorizer, _compile_tfidf_vectorizer),
+    (FunctionTransformer, _compile_function_transformer),
+]
+
+
+def compile_transformer(transformer):
+    """
+    Compile a fitted transformer into a function array -> array equivalent to its transform
+
+    :raise NotImplementedError: if the transformer (or one of its steps) is not supported
+    """
+    if hasattr(transformer, "compile_transform"):
+        return transformer.compile_transform()
+
+    for cls, compiler in _COMPILERS:
+        if type(transformer) is cls:
+            return compiler(transformer)
+
+    raise NotImplementedError(f"Cannot compile {type(transformer).__name__}")
+
+
+class CompiledPreprocessor:
+    """
+    A compiled ColumnTransformer (see compile_preprocessor)
+
+    :param blocks: list of (columns, function) with the columns used by each transformer and the
+                   compiled transformer
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.columns = list(dict.fromkeys(c for columns, _ in blocks for c in columns))
+
+    def transform(self, columns):
+        """
+        Compute the features
+
+        :param columns: dictionary column -> sequence of values, with the same length for all the columns
+        :return: the feature matrix, identical (values and type) to the dense output of the
+                 ColumnTransformer
+        """
+        outputs = []
+        for block_columns, transform in self.blocks:
+            X = np.empty((len(columns[block_columns[0]]), len(block_columns)), dtype=object)
+            for j, c in enumerate(block_columns):
+                X[:, j] = columns[c]
+
+            out = np.asarray(transform(X))
+            if out.dtype == object:
+                out = out.astype(np.float64)
+            outputs.append(out.reshape(len(X), -1))
+
+        return np.hstack(outputs)
+
+    def transform_records(self, records):
+        """
+        Compute the features of a list of records (dictionaries column -> value). Missing columns
+        are missing values
+        """
+        return self.transform({c: [record.get(c) for record in records] for c in self.columns})
+
+
+def compile_preprocessor(column_transformer):
+    """
+    Compile a fitted ColumnTransformer. Its columns must be selected by name, and the remainder
+    must be dropped
+
+    :param column_transformer: the fitted ColumnTransformer
+    :return: a CompiledPreprocessor
+    :raise NotImplementedError: if one of the transformers is not supported
+    """
+    if not isinstance(column_transformer, ColumnTransformer):
+        raise NotImplementedError(f"Cannot compile {type(column_transformer).__name__}")
+
+    blocks = []
+    for name, transformer, columns in column_transformer.transformers_:
+        if transformer == "drop" or len(columns) == 0:
+            continue
+        if name == "remainder" or transformer == "passthrough":
+            raise NotImplementedError("Cannot compile passthrough columns")
+        if isinstance(columns, str) or not all(isinstance(c, str) for c in columns):
+            raise NotImplementedError("Cannot compile columns not selected by a list of names")
+
+        blocks.append((list(columns), compile_transformer(transformer)))
+
+    return CompiledPreprocessor(blocks)
@@ -0,0 +1,273 @@
+"""
+Flat, array-backed export of a fitted scikit-learn random forest. All the nodes of all the trees
+are stored in a single structured array, saved as a raw .npy file that can be memory-mapped, so
+loading a forest does not deserialize anything and the pages are shared between the processes
+that load the same file. FlatForestPredictor predicts from this representation
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse
+from sklearn.metrics import r2_score
+
+
+# Version of the format, stored in the metadata
+FORMAT_VERSION = 1
+
+# Subdirectory of the MLflow model directory with the flat export of the forest
+FLAT_FOREST_DIR = "flat_forest"
+# The fitted preprocessing of the pipeline, pickled next to the forest, so the model can be loaded
+# without unpickling the forest
+PREPROCESSOR_FILENAME = "preprocessor.pkl"
+# The preprocessing compiled to a function of column arrays (see model_utils.compiled_features), if
+# it could be compiled
+COMPILED_PREPROCESSOR_FILENAME = "compiled_preprocessor.pkl"
+
+NODES_FILENAME = "nodes.npy"
+ROOTS_FILENAME = "roots.npy"
+METADATA_FILENAME = "flat_forest.json"
+
+# One record per node. left and right are indices in the array of all the nodes (not in the tree).
+# Leaves are their own children, with threshold +inf, so that traversing a leaf stays on it
+NODE_DTYPE = np.dtype([
+    ("feature", "<i4"),
+    ("left", "<i4"),
+    ("right", "<i4"),
+    ("threshold", "<f8"),
+    ("value", "<f8"),
+])
+
+
+class FlatForest:
+    """
+    The nodes of all the trees of a forest, in flat arrays
+
+    :param nodes: structured array of NODE_DTYPE with the nodes of all the trees
+    :param roots: index in nodes of the root of each tree
+    :param n_features: number of features of the input
+    :param max_depth: maximum depth of the trees (number of splits from a root to a leaf)
+    """
+
+    def __init__(self, nodes, roots, n_features, max_depth):
+        self.nodes = nodes
+        self.roots = roots
+        self.n_features = n_features
+        self.max_depth = max_depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_forest(cls, forest):
+        """
+        Convert a fitted RandomForestRegressor (single output)
+        """
+        n_nodes = sum(e.tree_.node_count for e in forest.estimators_)
+        nodes = np.empty(n_nodes, dtype=NODE_DTYPE)
+        roots = np.empty(len(forest.estimators_), dtype=np.int32)
+
+        offset = 0
+        for i, estimator in enumerate(forest.estimators_):
+            tree = estimator.tree_
+            n = tree.node_count
+            own = np.arange(offset, offset + n, dtype=np.int32)
+            leaf = tree.children_left == -1
+
+            block = nodes[offset:offset + n]
+            block["feature"] = np.where(leaf, 0, tree.feature)
+            block["left"] = np.where(leaf, own, tree.children_left + offset)
+            block["right"] = np.where(leaf, own, tree.children_right + offset)
+            block["threshold"] = np.where(leaf, np.inf, tree.threshold)
+            block["value"] = tree.value[:, 0, 0]
+
+            roots[i] = offset
+            offset += n
+
+        return cls(
+            nodes,
+            roots,
+            int(forest.n_features_in_),
+            max(int(e.tree_.max_depth) for e in forest.estimators_),
+        )
+
+    def save(self, path):
+        """
+        Save the forest in the directory path (created if needed)
+        """
+        os.makedirs(path, exist_ok=True)
+
+        np.save(os.path.join(path, NODES_FILENAME), np.ascontiguousarray(self.nodes))
+        np.save(os.path.join(path, ROOTS_FILENAME), np.ascontiguousarray(self.roots))
+
+        with open(os.path.join(path, METADATA_FILENAME), "w+") as fp:
+            json.dump(
+                {
+                    "format_version": FORMAT_VERSION,
+                    "n_trees": self.n_trees,
+                    "n_nodes": len(self.nodes),
+                    "n_features": self.n_features,
+                    "max_depth": self.max_depth,
+                },
+                fp,
+            )
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a forest saved with save
+
+        :param path: the directory of the forest
+        :param mmap: whether to memory-map the nodes (read-only) instead of reading them in memory
+        """
+        with open(os.path.join(path, METADATA_FILENAME)) as fp:
+            metadata = json.load(fp)
+
+        if metadata["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported flat forest format version {metadata['format_version']}")
+
+        return cls(
+            np.load(os.path.join(path, NODES_FILENAME), mmap_mode="r" if mmap else None),
+            np.load(os.path.join(path, ROOTS_FILENAME)),
+            metadata["n_features"],
+            metadata["max_depth"],
+        )
+
+
+class FlatForestPredictor:
+    """
+    Prediction with a FlatForest. This is not an estimator: it is built from a fitted
+    RandomForestRegressor (see from_forest) or loaded from an export (see load_flat_pipeline).
+
+    It is meant for online scoring of small batches: with 100 trees of depth 15 it is about 20x
+    faster than RandomForestRegressor.predict for one row and 3x faster for 64 rows, but it becomes
+    slower above a few hundred rows (3x slower for 15k rows). Score large datasets with the
+    RandomForestRegressor instead.
+
+    A batch is evaluated on all the trees at once, descending one level of all the trees at each
+    step with vectorized gathers. The predictions are bit-identical to those of the
+    RandomForestRegressor predicting with n_jobs=1: the input is converted to float32 and compared
+    with the float64 thresholds like in scikit-learn, and the values of the trees are summed in the
+    same order before dividing by the number of trees
+
+    :param flat_forest: the FlatForest
+    :param batch_size: number of rows evaluated at once (the memory used is proportional to
+                       batch_size times the number of trees)
+    """
+
+    def __init__(self, flat_forest, batch_size=4096):
+        self.flat_forest = flat_forest
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_forest(cls, forest, **kwargs):
+        """
+        Build the predictor of a fitted RandomForestRegressor
+        """
+        return cls(FlatForest.from_forest(forest), **kwargs)
+
+    def _predict_batch(self, X):
+        forest = self.flat_forest
+        nodes = forest.nodes
+
+        # Views on the fields of the nodes (gathering from them is much faster than gathering records)
+        feature, threshold, left, right = (nodes[field] for field in ["feature", "threshold", "left", "right"])
+
+        # Flat indices in X of the first feature of each row
+        x = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+
+        index = np.repeat(forest.roots[None, :], len(X), axis=0)
+
+        for _ in range(forest.max_depth):
+            go_left = x[row_offsets + feature[index]] <= threshold[index]
+            next_index = np.where(go_left, left[index], right[index])
+
+            # All the rows reached a leaf of all the trees
+            if np.array_equal(next_index, index):
+                break
+            index = next_index
+
+        values = nodes["value"][index]
+
+        # Same order of the sums as RandomForestRegressor, for identical rounding
+        y = np.zeros(len(X), dtype=np.float64)
+        for tree in range(forest.n_trees):
+            y += values[:, tree]
+
+        return y / forest.n_trees
+
+    def predict(self, X):
+        """
+        Predict the target for the rows of X (dense or sparse)
+        """
+        if scipy.sparse.issparse(X):
+            X = X.toarray()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        if X.ndim != 2 or X.shape[1] != self.flat_forest.n_features:
+            raise ValueError(f"Expected {self.flat_forest.n_features} features, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("FlatForestPredictor does not support missing values")
+
+        return np.concatenate([
+            self._predict_batch(X[start:start + self.batch_size])
+            for start in range(0, len(X), self.batch_size)
+        ] or [np.empty(0)])
+
+
+class FlatPipeline:
+    """
+    The fitted preprocessing of a model followed by the FlatForestPredictor of its forest: the
+    prediction-only counterpart of the inference pipeline (see load_flat_pipeline)
+
+    :param preprocessor: the fitted preprocessing (the "preprocessor" step of the pipeline)
+    :param forest: the FlatForestPredictor
+    """
+
+    def __init__(self, preprocessor, forest):
+        self.preprocessor = preprocessor
+        self.forest = forest
+
+    def predict(self, X):
+        """
+        Predict the target for the rows of the DataFrame X
+        """
+        return self.forest.predict(self.preprocessor.transform(X))
+
+    def score(self, X, y):
+        """
+        Coefficient of determination of the predictions for X, like the score of the pipeline
+        """
+        return r2_score(y, self.predict(X))
+
+
+def load_flat_pipeline(path, mmap=True, **kwargs):
+    """
+    Load the flat export of a model (the FLAT_FOREST_DIR subdirectory of the MLflow model
+    directory) as a FlatPipeline, without unpickling the original forest
+
+    :param path: the directory of the flat export
+    :param mmap: whether to memory-map the nodes of the forest
+    :param kwargs: other arguments for FlatForestPredictor
+    :return: the FlatPipeline
+    """
+    with open(os.path.join(path, PREPROCESSOR_FILENAME), "rb") as fp:
+        preprocessor = pickle.load(fp)
+
+    return FlatPipeline(preprocessor, FlatForestPredictor(FlatForest.load(path, mmap=mmap), **kwargs))
+
+
+def load_compiled_preprocessor(path):
+    """
+    Load the compiled preprocessing (see model_utils.compiled_features) of the flat export of a
+    model, or return None if the export does not have one
+    """
+    compiled_path = os.path.join(path, COMPILED_PREPROCESSOR_FILENAME)
+    if not os.path.exists(compiled_path):
+        return None
+
+    with open(compiled_path, "rb") as fp:
+        return pickle.load(fp)
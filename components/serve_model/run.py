@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+This step serves the model tagged with the "prod" tag: an ASGI application that predicts the price
+of the listings posted as JSON, batching concurrent requests together
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import time
+
+import mlflow
+import numpy as np
+import pandas as pd
+import uvicorn
+import wandb
+
+from model_utils.batching import BatcherStoppedError, MicroBatcher, QueueFullError
+from model_utils.flat_forest import FLAT_FOREST_DIR, FlatPipeline, load_compiled_preprocessor, load_flat_pipeline
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
+logger = logging.getLogger()
+
+
+class RecordEncoder:
+    """
+    Convert a list of records (dictionaries column -> value) into the input of the pipeline, going
+    through one list per column instead of building a DataFrame for each record. Missing columns are
+    None, and are handled by the imputers of the pipeline
+
+    :param columns: the columns of the input of the pipeline
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    def __call__(self, records):
+        return pd.DataFrame({c: [record.get(c) for record in records] for c in self.columns})
+
+
+class LatencyMetrics:
+    """
+    Latencies of the last requests, and sizes of the last batches
+
+    :param window: number of requests and batches kept
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.n_requests = 0
+
+    def record_request(self, latency):
+        self.latencies.append(latency)
+        self.n_requests += 1
+
+    def record_batch(self, size):
+        self.batch_sizes.append(size)
+
+    def to_dict(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "n_requests": self.n_requests,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+        }
+
+
+class ScoringApp:
+    """
+    ASGI application with the routes:
+
+    * POST /predict: body is a listing (JSON object) or a list of listings, response is
+      {"predictions": [...]} with one predicted price per listing
+    * GET /metrics: latency percentiles (over the last requests) and mean batch size
+    * GET /health
+
+    :param model: the inference pipeline, or its flat export (a FlatPipeline, see load_model)
+    :param compiled_preprocessor: the compiled preprocessing of the flat export (see
+                                  model_utils.compiled_features), or None to use the preprocessor
+    :param max_batch_size: maximum number of listings predicted together
+    :param max_wait: maximum time (in seconds) a request waits for others to join its batch
+    :param max_queue_size: maximum number of requests waiting for a batch. Further requests are
+                           rejected with status 503 (0 for no limit)
+    """
+
+    def __init__(self, model, compiled_preprocessor=None, max_batch_size=64, max_wait=0.002, max_queue_size=0):
+        self.model = model
+        self.compiled_preprocessor = compiled_preprocessor
+        preprocessor = model.preprocessor if isinstance(model, FlatPipeline) else model["preprocessor"]
+        self.encoder = RecordEncoder(preprocessor.feature_names_in_)
+        self.metrics = LatencyMetrics()
+        self.batcher = MicroBatcher(
+            self.predict_batch, max_batch_size=max_batch_size, max_wait=max_wait, max_queue_size=max_queue_size
+        )
+
+    def predict_batch(self, records):
+        self.metrics.record_batch(len(records))
+
+        if self.compiled_preprocessor is not None:
+            # Straight from the records to the features, without a DataFrame
+            return self.model.forest.predict(self.compiled_preprocessor.transform_records(records)).tolist()
+
+        return self.model.predict(self.encoder(records)).tolist()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        if scope["method"] == "POST" and scope["path"] == "/predict":
+            await self._predict(receive, send)
+        elif scope["method"] == "GET" and scope["path"] == "/metrics":
+            await _send_json(
+                send,
+                200,
+                {**self.metrics.to_dict(), "queue_size": self.batcher.qsize(), "n_rejected": self.batcher.n_rejected}
+            )
+        elif scope["method"] == "GET" and scope["path"] == "/health":
+            await _send_json(send, 200, {"status": "ok"})
+        else:
+            await _send_json(send, 404, {"error": "not found"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _predict(self, receive, send):
+        start = time.perf_counter()
+
+        try:
+            records = json.loads(await _read_body(receive))
+        except ValueError:
+            await _send_json(send, 400, {"error": "the body must be JSON"})
+            return
+
+        if isinstance(records, dict):
+            records = [records]
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            await _send_json(send, 400, {"error": "expected a listing or a list of listings"})
+            return
+
+        try:
+            predictions = await self.batcher.submit(records) if records else []
+        except QueueFullError:
+            await _send_json(send, 503, {"error": "too many pending requests"}, [(b"retry-after", b"1")])
+            return
+        except BatcherStoppedError:
+            await _send_json(send, 503, {"error": "the server is shutting down"})
+            return
+
+        self.metrics.record_request(time.perf_counter() - start)
+        await _send_json(send, 200, {"predictions": predictions})
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def _send_json(send, status, content, headers=()):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def load_model(model_local_path):
+    """
+    Load the model, from its flat export if it has one (see model_utils.flat_forest). The flat
+    export predicts the small batches of the service much faster than the pipeline
+
+    :return: the pipeline or FlatPipeline, and the compiled preprocessing of the flat export (or
+             None if there is none)
+    """
+    flat_forest_path = os.path.join(model_local_path, FLAT_FOREST_DIR)
+    if os.path.isdir(flat_forest_path):
+        return load_flat_pipeline(flat_forest_path), load_compiled_preprocessor(flat_forest_path)
+
+    return mlflow.sklearn.load_model(model_local_path), None
+
+
+def go(args):
+
+    run = wandb.init(job_type="serve_model")
+    run.config.update(args)
+
+    logger.info("Downloading model")
+    model_local_path = run.use_artifact(args.mlflow_model).download()
+    run.finish()
+
+    logger.info("Loading model")
+    model, compiled_preprocessor = load_model(model_local_path)
+
+    app = ScoringApp(
+        model,
+        compiled_preprocessor,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue_size=args.max_queue_size,
+    )
+
+    logger.info(f"Serving {args.mlflow_model} on {args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, lifespan="on")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve the provided model over HTTP")
+
+    parser.add_argument(
+        "--mlflow_model",
+        type=str,
+        help="Input MLFlow model",
+        required=True
+    )
+
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="Interface to listen on",
+        default="127.0.0.1",
+        required=False
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="Port to listen on",
+        default=8000,
+        required=False
+    )
+
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        help="Maximum number of listings predicted together",
+        default=64,
+        required=False
+    )
+
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        help="Maximum time (in milliseconds) a request waits for other requests to join its batch",
+        default=2.0,
+        required=False
+    )
+
+    parser.add_argument(
+        "--max_queue_size",
+        type=int,
+        help="Maximum number of requests waiting for a batch. Further requests are rejected with "
+        "status 503 (0 for no limit)",
+        default=1024,
+        required=False
+    )
+
+    args = parser.parse_args()
+
+    go(args)
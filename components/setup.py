@@ -6,13 +6,17 @@ setup(
     version=0.1,
     description="Utilities for interacting with Weights and Biases and mlflow",
     zip_safe=False,  # avoid eggs, which make the handling of package data cumbersome
-    packages=["wandb_utils"],
+    packages=["wandb_utils", "model_utils"],
     classifiers=[
         "Programming Language :: Python :: 3",
         "Development Status :: 4 - Beta",
     ],
     install_requires=[
         "mlflow",
+        "numpy",
+        "pandas",
+        "scikit-learn",
+        "scipy",
         "wandb"
     ]
 )
@@ -4,12 +4,17 @@ This step takes the best model, tagged with the "prod" tag, and tests it against
 """
 import argparse
 import logging
+import os
+import time
 import wandb
 import mlflow
-import pandas as pd
 from sklearn.metrics import mean_absolute_error
 
+from model_utils.flat_forest import FLAT_FOREST_DIR, load_flat_pipeline
+from wandb_utils.artifact_io import use_table
 from wandb_utils.log_artifact import log_artifact
+from wandb_utils.schema import LISTING_SCHEMA
+from wandb_utils.split_index import use_split
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
@@ -26,16 +31,28 @@ def go(args):
     # particular version of the artifact
     model_local_path = run.use_artifact(args.mlflow_model).download()
 
-    # Download test dataset
-    test_dataset_path = run.use_artifact(args.test_dataset).file()
-
-    # Read test dataset
-    X_test = pd.read_csv(test_dataset_path)
+    # Download and read test dataset
+    X_test = use_table(run, args.test_dataset, schema=LISTING_SCHEMA)
+    if args.split_artifact != "none":
+        # The test dataset is the base table of the split: only keep its test rows
+        X_test = use_split(run, args.split_artifact, base_artifact=args.test_dataset).take(X_test, "test")
     y_test = X_test.pop("price")
 
     logger.info("Loading model and performing inference on test set")
-    sk_pipe = mlflow.sklearn.load_model(model_local_path)
+    start = time.perf_counter()
+    flat_forest_path = os.path.join(model_local_path, FLAT_FOREST_DIR)
+    if args.use_flat_forest == "true" and os.path.isdir(flat_forest_path):
+        # Memory-map the flat export of the forest instead of unpickling it
+        sk_pipe = load_flat_pipeline(flat_forest_path)
+    else:
+        if args.use_flat_forest == "true":
+            logger.warning(f"{args.mlflow_model} has no flat export of the forest, loading the MLflow model")
+        sk_pipe = mlflow.sklearn.load_model(model_local_path)
+    run.summary['load_time'] = time.perf_counter() - start
+
+    start = time.perf_counter()
     y_pred = sk_pipe.predict(X_test)
+    run.summary['predict_time'] = time.perf_counter() - start
 
     logger.info("Scoring")
     r_squared = sk_pipe.score(X_test, y_test)
@@ -68,6 +85,25 @@ if __name__ == "__main__":
         required=True
     )
 
+    parser.add_argument(
+        "--split_artifact",
+        type=str,
+        help="Split of the test dataset made by train_val_test_split with split_mode index, or none "
+        "if the test dataset only contains the test rows",
+        default="none",
+        required=False
+    )
+
+    parser.add_argument(
+        "--use_flat_forest",
+        type=str,
+        choices=["true", "false"],
+        help="Whether to predict with the flat export of the forest, if the model has one. The "
+        "flat export is faster only for small batches: it is about 3x slower on a whole test set",
+        default="false",
+        required=False
+    )
+
     args = parser.parse_args()
 
     go(args)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import wandb_utils and model_utils from this directory, without installing them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from wandb_utils.artifact_io import FORMATS, TableWriter, iter_table, read_table, table_filename
+from wandb_utils.schema import LISTING_SCHEMA
+
+
+@pytest.mark.parametrize("fmt", list(FORMATS))
+def test_table_writer_without_chunks_writes_an_empty_table(tmp_path, fmt):
+    path = str(tmp_path / table_filename("empty", fmt))
+    schema = {"price": "float32", "minimum_nights": "int32"}
+
+    with TableWriter(path, schema=schema):
+        pass
+
+    df = read_table(path, schema=schema)
+    assert len(df) == 0
+    assert list(df.columns) == ["price", "minimum_nights"]
+    assert df.dtypes.to_dict() == {"price": "float32", "minimum_nights": "int32"}
+
+
+@pytest.mark.parametrize("fmt", list(FORMATS))
+def test_chunked_write_with_categories_round_trip(tmp_path, fmt):
+    source = tmp_path / "source.csv"
+    pd.DataFrame({
+        "room_type": ["Private room", "Entire home/apt", "Shared room", None, "Private room", "Hotel room"],
+        "price": [10.5, 20.0, 30.0, 40.0, None, 60.0],
+        "number_of_reviews": [1, 2, 3, 4, 5, 6],
+    }).to_csv(source, index=False)
+
+    # Every chunk of 2 rows has different categories
+    path = str(tmp_path / table_filename("clean", fmt))
+    with TableWriter(path, schema=LISTING_SCHEMA) as writer:
+        for chunk in iter_table(str(source), 2, schema=LISTING_SCHEMA):
+            writer.write(chunk)
+
+    expected = read_table(str(source), schema=LISTING_SCHEMA)
+    df = read_table(path, schema=LISTING_SCHEMA)
+    assert writer.n_rows == 6
+    assert isinstance(df["room_type"].dtype, pd.CategoricalDtype)
+    assert df["price"].dtype == "float32" and df["number_of_reviews"].dtype == "int32"
+    pd.testing.assert_frame_equal(df, expected, check_categorical=False)
+
+    chunks = list(iter_table(path, 2, schema=LISTING_SCHEMA))
+    assert sum(len(chunk) for chunk in chunks) == 6
+    assert all(isinstance(chunk["room_type"].dtype, pd.CategoricalDtype) for chunk in chunks)
@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_utils.batching import BatchedModel, BatcherStoppedError, MicroBatcher
+
+
+class SumModel:
+    def predict(self, X):
+        return X.sum(axis=1).to_numpy()
+
+
+def test_bad_request_only_fails_its_batch():
+
+    async def scenario():
+        async with BatchedModel(SumModel(), max_wait=0.001) as model:
+            with pytest.raises(TypeError):
+                # A list of dictionaries cannot be concatenated with pd.concat
+                await model.predict([{"a": 1.0}])
+
+            assert not model.batcher._worker.done()
+            return await asyncio.wait_for(model.predict(pd.DataFrame({"a": [1.0, 2.0], "b": [3.0, 4.0]})), 1)
+
+    assert asyncio.run(scenario()) == [4.0, 6.0]
+
+
+def test_failed_prediction_does_not_stop_the_worker():
+    calls = []
+
+    def predict_batch(records):
+        calls.append(records)
+        if len(calls) == 1:
+            raise RuntimeError("model failure")
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(predict_batch, max_wait=0.001)
+        await batcher.start()
+        with pytest.raises(RuntimeError):
+            await batcher.submit([1])
+        result = await asyncio.wait_for(batcher.submit([2, 3]), 1)
+        await batcher.stop()
+        return result
+
+    assert asyncio.run(scenario()) == [2, 3]
+
+
+def test_stop_fails_the_pending_requests():
+
+    async def scenario():
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def predict_batch(records):
+            # Block the batch being predicted until the batcher is stopped
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+            return records
+
+        batcher = MicroBatcher(predict_batch, max_batch_size=1, max_wait=0)
+        await batcher.start()
+
+        tasks = [asyncio.create_task(batcher.submit([i])) for i in range(3)]
+        await asyncio.sleep(0.05)
+        # One request is being predicted, the others are queued
+        assert batcher.qsize() == 2
+
+        await batcher.stop()
+        release.set()
+
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+        with pytest.raises(BatcherStoppedError):
+            await batcher.submit([3])
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, BatcherStoppedError) for r in results)
+
+
+def test_requests_are_batched():
+    sizes = []
+
+    def predict_batch(records):
+        sizes.append(len(records))
+        return np.asarray(records) * 2
+
+    async def scenario():
+        batcher = MicroBatcher(predict_batch, max_batch_size=10, max_wait=0.05)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit([i]) for i in range(5)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(scenario()) == [[0], [2], [4], [6], [8]]
+    assert sizes == [5]
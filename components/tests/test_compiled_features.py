@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder
+
+from model_utils.compiled_features import compile_preprocessor
+
+
+def _listings():
+    return pd.DataFrame({
+        "room_type": ["Private room", "Entire home/apt", "Shared room", "Private room", "Entire home/apt"],
+        "neighbourhood_group": ["Brooklyn", None, "Queens", "Brooklyn", "Manhattan"],
+        "minimum_nights": [1, 3, np.nan, 2, 30],
+        "reviews_per_month": [0.5, np.nan, 1.25, 3.0, 0.1],
+        "name": ["Cozy room in Brooklyn", None, "Sunny loft", "Room, near the park", "Loft in Manhattan"],
+    })
+
+
+def _preprocessor(sparse_threshold):
+    return ColumnTransformer(
+        transformers=[
+            ("ordinal_cat", OrdinalEncoder(dtype=np.float32), ["room_type"]),
+            ("non_ordinal_cat", Pipeline([
+                ("imputer", SimpleImputer(strategy="most_frequent")),
+                ("encoder", OneHotEncoder(dtype=np.float32)),
+            ]), ["neighbourhood_group"]),
+            ("impute_zero", SimpleImputer(strategy="constant", fill_value=0), ["minimum_nights", "reviews_per_month"]),
+            ("transform_name", Pipeline([
+                ("imputer", SimpleImputer(strategy="constant", fill_value="")),
+                ("reshape", FunctionTransformer(np.reshape, kw_args={"newshape": -1})),
+                ("tfidf", TfidfVectorizer(binary=False, max_features=10, stop_words="english")),
+            ]), ["name"]),
+        ],
+        remainder="drop",
+        sparse_threshold=sparse_threshold,
+    )
+
+
+@pytest.mark.parametrize("sparse_threshold", [0, 0.3])
+def test_compiled_features_are_identical(sparse_threshold):
+    X = _listings()
+    preprocessor = _preprocessor(sparse_threshold).fit(X)
+
+    expected = preprocessor.transform(X)
+    if hasattr(expected, "toarray"):
+        expected = expected.toarray()
+
+    compiled = compile_preprocessor(preprocessor)
+    features = compiled.transform({c: X[c].to_numpy() for c in compiled.columns})
+
+    assert features.dtype == expected.dtype
+    np.testing.assert_array_equal(features, expected)
+
+
+def test_compiled_records_are_identical():
+    X = _listings()
+    preprocessor = _preprocessor(0).fit(X)
+
+    compiled = compile_preprocessor(preprocessor)
+    records = X.astype(object).where(X.notna(), None).to_dict(orient="records")
+
+    np.testing.assert_array_equal(compiled.transform_records(records), preprocessor.transform(X))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pickle
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.impute import SimpleImputer
+
+from model_utils.flat_forest import (
+    FlatForest, FlatForestPredictor, FlatPipeline, PREPROCESSOR_FILENAME, load_flat_pipeline
+)
+
+
+def _fit_forest(n_rows=500, n_features=6):
+    rng = np.random.default_rng(0)
+    X = rng.random((n_rows, n_features))
+    y = X[:, 0] * 10 + rng.random(n_rows)
+    return RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0).fit(X, y), X
+
+
+def test_predictions_are_identical_to_the_forest():
+    forest, X = _fit_forest()
+
+    predictor = FlatForestPredictor.from_forest(forest, batch_size=64)
+
+    np.testing.assert_array_equal(predictor.predict(X), forest.predict(X))
+
+
+def test_flat_pipeline_round_trip(tmp_path):
+    forest, X = _fit_forest()
+    df = pd.DataFrame(X, columns=[f"x{i}" for i in range(X.shape[1])])
+    preprocessor = ColumnTransformer([("impute", SimpleImputer(), list(df.columns))]).fit(df)
+
+    FlatForest.from_forest(forest).save(str(tmp_path))
+    with open(tmp_path / PREPROCESSOR_FILENAME, "wb") as fp:
+        pickle.dump(preprocessor, fp)
+
+    model = load_flat_pipeline(str(tmp_path))
+
+    assert isinstance(model, FlatPipeline)
+    np.testing.assert_array_equal(model.predict(df), forest.predict(preprocessor.transform(df)))
+    assert not hasattr(model.forest, "fit")
@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 """
-This script splits the provided dataframe in test and remainder
+This script splits the provided dataframe in test and remainder, either as copies of the rows or
+as row indices (see wandb_utils.split_index)
 """
 import argparse
 import logging
-import pandas as pd
+import os
+import numpy as np
 import wandb
 import tempfile
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import RepeatedKFold, RepeatedStratifiedKFold, train_test_split
+from wandb_utils.artifact_io import FORMATS, share_table, table_filename, use_table, write_table
 from wandb_utils.log_artifact import log_artifact
+from wandb_utils.schema import LISTING_SCHEMA
+from wandb_utils.split_index import SplitIndex
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
 logger = logging.getLogger()
@@ -19,12 +24,14 @@ def go(args):
     run = wandb.init(job_type="train_val_test_split")
     run.config.update(args)
 
+    if args.split_mode == "index":
+        split_index(run, args)
+        return
+
     # Download input artifact. This will also note that this script is using this
     # particular version of the artifact
     logger.info(f"Fetching artifact {args.input}")
-    artifact_local_path = run.use_artifact(args.input).file()
-
-    df = pd.read_csv(artifact_local_path)
+    df = use_table(run, args.input, schema=LISTING_SCHEMA)
 
     logger.info("Splitting trainval and test")
     trainval, test = train_test_split(
@@ -37,17 +44,98 @@ def go(args):
     # Save to output files
     for df, k in zip([trainval, test], ['trainval', 'test']):
         logger.info(f"Uploading {k}_data.csv dataset")
-        with tempfile.NamedTemporaryFile("w") as fp:
+        with tempfile.TemporaryDirectory() as tmp_dir:
 
-            df.to_csv(fp.name, index=False)
+            path = os.path.join(tmp_dir, table_filename(f"{k}_data", args.output_format))
+            write_table(df, path, schema=LISTING_SCHEMA)
 
             log_artifact(
                 f"{k}_data.csv",
                 f"{k}_data",
                 f"{k} split of dataset",
-                fp.name,
+                path,
                 run,
             )
+            share_table(f"{k}_data.csv", df)
+
+
+def split_index(run, args):
+    """
+    Split the rows of the input artifact into trainval and test (and the trainval rows into
+    cross-validation folds if args.n_splits > 0), and log the positions of the rows as the
+    "data_split" artifact instead of copies of the rows
+    """
+    # Only the stratification column is needed to split the rows
+    logger.info(f"Fetching artifact {args.input}")
+    base_digest = run.use_artifact(args.input).digest
+    column = args.stratify_by if args.stratify_by != "none" else "id"
+    values = use_table(run, args.input, columns=[column], schema=LISTING_SCHEMA)[column]
+    stratify = values if args.stratify_by != "none" else None
+
+    logger.info("Splitting trainval and test")
+    # The same rows as the copies of the default mode, for the same parameters
+    trainval, test = train_test_split(
+        np.arange(len(values), dtype=np.int32),
+        test_size=args.test_size,
+        random_state=args.random_seed,
+        stratify=stratify,
+    )
+
+    folds = None
+    if args.n_splits > 0:
+        logger.info(f"Assigning the trainval rows to {args.n_repeats} x {args.n_splits} folds")
+        folds = make_folds(
+            stratify.iloc[trainval] if stratify is not None else None,
+            len(trainval),
+            args.n_splits,
+            args.n_repeats,
+            args.random_seed,
+        )
+
+    split = SplitIndex(
+        len(values),
+        {"trainval": trainval, "test": test},
+        folds,
+        metadata={
+            "base_artifact": args.input,
+            "base_digest": base_digest,
+            "test_size": args.test_size,
+            "random_seed": args.random_seed,
+            "stratify_by": args.stratify_by,
+        },
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        split.save(tmp_dir)
+
+        logger.info("Uploading data_split")
+        artifact = wandb.Artifact(
+            "data_split",
+            type="split_index",
+            description=f"Positions of the trainval and test rows of {args.input}",
+        )
+        artifact.add_dir(tmp_dir)
+        run.log_artifact(artifact)
+        artifact.wait()
+
+
+def make_folds(stratify, n_rows, n_splits, n_repeats, random_seed):
+    """
+    Assign rows to cross-validation folds, stratified by the provided values (if not None)
+
+    :return: int8 array (n_repeats, n_rows) with the fold of each row in each repetition
+    """
+    if stratify is not None:
+        cv = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_seed)
+    else:
+        cv = RepeatedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=random_seed)
+
+    folds = np.empty((n_repeats, n_rows), dtype=np.int8)
+    # The folds of each repetition are generated one after the other
+    for i, (_, val) in enumerate(cv.split(np.zeros(n_rows), stratify)):
+        folds[i // n_splits, val] = i % n_splits
+
+    return folds
 
 
 if __name__ == "__main__":
@@ -67,6 +155,46 @@ if __name__ == "__main__":
         "--stratify_by", type=str, help="Column to use for stratification", default='none', required=False
     )
 
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        help="Serialization format for the trainval and test artifacts",
+        choices=list(FORMATS),
+        default="csv",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--split_mode",
+        type=str,
+        help="copy: log copies of the trainval and test rows. index: log the positions of the rows "
+        "in the input as the data_split artifact (see wandb_utils.split_index)",
+        choices=["copy", "index"],
+        default="copy",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--n_splits",
+        type=int,
+        help="Number of cross-validation folds of the trainval rows (0 for none). Needs --split_mode index",
+        default=0,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--n_repeats",
+        type=int,
+        help="Number of repetitions of the cross-validation, with different folds",
+        default=1,
+        required=False,
+    )
+
     args = parser.parse_args()
 
+    if args.n_splits > 0 and args.split_mode != "index":
+        parser.error("--n_splits needs --split_mode index")
+    if args.n_splits == 1 or args.n_splits > np.iinfo(np.int8).max:
+        parser.error("--n_splits must be 0 or between 2 and 127")
+
     go(args)
@@ -0,0 +1,282 @@
+import os
+
+import pandas as pd
+
+from wandb_utils.schema import apply_schema, schema_for
+
+
+# Supported serialization formats for tabular artifacts, and the file extension used for each.
+# Parquet and Arrow IPC need pyarrow to be installed
+FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+def table_filename(stem, fmt):
+    """
+    Return the filename to use for a table artifact in the given format
+
+    :param stem: filename without extension (for example "clean_sample")
+    :param fmt: one of the keys of FORMATS
+    :return: the filename, with the extension of the format
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown artifact format {fmt}. Use one of {', '.join(FORMATS)}")
+
+    return stem + FORMATS[fmt]
+
+
+def _format_from_path(path):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+
+    raise ValueError(f"Cannot infer the artifact format of {path}")
+
+
+def write_table(df, path, schema=None, compression="zstd"):
+    """
+    Write a dataframe to path. The format is inferred from the extension of path (see FORMATS)
+
+    :param df: dataframe to write
+    :param path: destination file
+    :param schema: optional dictionary column -> dtype. The columns are cast to these types before
+                   writing, so Parquet and Arrow files carry the declared types
+    :param compression: compression codec for Parquet and Arrow files (ignored for CSV)
+    :return: None
+    """
+    fmt = _format_from_path(path)
+
+    if schema is not None:
+        df = df.astype({k: v for k, v in schema.items() if k in df.columns})
+
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False, compression=compression)
+    else:
+        df.reset_index(drop=True).to_feather(path, compression=compression)
+
+
+def read_table(path, columns=None, schema=None):
+    """
+    Read a table written by write_table (or any CSV file). The format is inferred from the extension
+
+    :param path: file to read
+    :param columns: optional list of columns to read. For Parquet and Arrow files only these columns
+                    are decoded from disk
+    :param schema: optional dictionary column -> dtype (see wandb_utils.schema). CSV files are parsed
+                   directly into these types, Parquet and Arrow files are cast after reading (which
+                   copies nothing if they were written with the same schema)
+    :return: a pandas DataFrame
+    """
+    fmt = _format_from_path(path)
+
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=columns, dtype=_csv_dtype(path, columns, schema))
+    elif fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_feather(path, columns=columns)
+
+    return _apply_optional_schema(df, schema)
+
+
+def _csv_dtype(path, columns, schema):
+    if schema is None:
+        return None
+
+    # read_csv only accepts types for columns of the file
+    header = pd.read_csv(path, nrows=0).columns
+    return schema_for(schema, header if columns is None else [c for c in columns if c in header])
+
+
+def _apply_optional_schema(df, schema):
+    return apply_schema(df, schema) if schema is not None else df
+
+
+def iter_table(path, chunksize, columns=None, schema=None):
+    """
+    Iterate over a table written by write_table (or any CSV file) in chunks, without loading all of
+    it in memory
+
+    :param path: file to read
+    :param chunksize: number of rows per chunk. For Arrow files the chunks are the record batches
+                      stored in the file, which are chunksize rows long if the file was written by
+                      TableWriter
+    :param columns: optional list of columns to read
+    :param schema: optional dictionary column -> dtype (see read_table)
+    :return: an iterator over pandas DataFrames
+    """
+    fmt = _format_from_path(path)
+
+    if fmt == "csv":
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize, dtype=_csv_dtype(path, columns, schema))
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield _apply_optional_schema(batch.to_pandas(), schema)
+    else:
+        import pyarrow as pa
+
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                df = (batch.select(columns) if columns is not None else batch).to_pandas()
+                yield _apply_optional_schema(df, schema)
+
+
+class TableWriter:
+    """
+    Write a table chunk by chunk, so that it never needs to be entirely in memory. The format is
+    inferred from the extension of path (see FORMATS). Use it as a context manager:
+
+        with TableWriter("clean_sample.parquet") as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+    The schema of the file is the schema of the first chunk (after applying the optional
+    declared schema, see write_table). The following chunks are cast to it. If no chunk is written,
+    closing the writer creates an empty table with the columns of the declared schema
+    """
+
+    def __init__(self, path, schema=None, compression="zstd"):
+        self.path = path
+        self.fmt = _format_from_path(path)
+        self.schema = schema
+        self.compression = compression
+
+        self._writer = None
+        self._arrow_schema = None
+        self._written = False
+        self.n_rows = 0
+
+    def write(self, df):
+        if self.schema is not None:
+            df = df.astype({k: v for k, v in self.schema.items() if k in df.columns})
+
+        if self.fmt == "csv":
+            df.to_csv(self.path, index=False, mode="w" if self.n_rows == 0 else "a", header=self.n_rows == 0)
+        else:
+            import pyarrow as pa
+
+            # Each chunk has its own categories, and Arrow IPC files cannot change the dictionary
+            # of a column between batches: store the categorical columns as their values. They
+            # are categorical again when read with the schema
+            df = df.astype({
+                c: df[c].cat.categories.dtype for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)
+            })
+            table = pa.Table.from_pandas(df, schema=self._arrow_schema, preserve_index=False)
+            if self._writer is None:
+                self._arrow_schema = table.schema
+                self._writer = self._open(table.schema)
+
+            self._writer.write_table(table)
+
+        self._written = True
+        self.n_rows += len(df)
+
+    def _open(self, schema):
+        import pyarrow as pa
+
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(self.path, schema, compression=self.compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if not self._written:
+            # Empty input: the file must still exist
+            self.write(pd.DataFrame({c: pd.Series(dtype=dtype) for c, dtype in (self.schema or {}).items()}))
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Tables produced in this process, by artifact name. This is only populated when the pipeline
+# runs all its steps in a single interpreter (see enable_memory_store), so that downstream steps
+# can reuse the DataFrame instead of downloading and parsing the artifact again
+_memory_store = None
+
+
+def enable_memory_store():
+    """
+    Keep the tables shared with share_table in memory, so that use_table can return them without
+    downloading the corresponding artifact
+    """
+    global _memory_store
+    if _memory_store is None:
+        _memory_store = {}
+
+
+def memory_store_enabled():
+    """
+    Return True if the tables shared with share_table are kept in memory
+    """
+    return _memory_store is not None
+
+
+def share_table(artifact_name, df):
+    """
+    Make df available to the following steps running in this process as the latest version of
+    artifact_name. This is a no-op unless enable_memory_store has been called
+
+    :param artifact_name: name of the artifact the table has been logged as
+    :param df: the table
+    :return: None
+    """
+    if _memory_store is not None:
+        _memory_store[artifact_name] = df
+
+
+def use_table(wandb_run, artifact, columns=None, schema=None):
+    """
+    Declare that wandb_run uses the provided artifact and return its content as a DataFrame.
+    If the latest version of the artifact was produced in this same process (see share_table), the
+    table is taken from memory instead of being downloaded
+
+    :param wandb_run: current Weights & Biases run
+    :param artifact: artifact name, with an optional alias (for example "clean_sample.csv:latest")
+    :param columns: optional list of columns to read
+    :param schema: optional dictionary column -> dtype (see read_table)
+    :return: a pandas DataFrame
+    """
+    wandb_artifact = wandb_run.use_artifact(artifact)
+
+    name, _, alias = artifact.partition(":")
+    if _memory_store is not None and name in _memory_store and alias in ("", "latest"):
+        df = _memory_store[name]
+        df = df[columns].copy() if columns is not None else df.copy()
+        return _apply_optional_schema(df, schema)
+
+    return read_table(download_table(wandb_artifact), columns=columns, schema=schema)
+
+
+def download_table(wandb_artifact):
+    """
+    Download the table contained in a W&B artifact and return its local path. The artifact can
+    contain other files (like a statistics sidecar), but only one table
+
+    :param wandb_artifact: the artifact, as returned by use_artifact
+    :return: the local path of the table
+    """
+    names = [n for n in wandb_artifact.manifest.entries if os.path.splitext(n)[1].lower() in FORMATS.values()]
+    if len(names) != 1:
+        raise ValueError(f"Expected one table in artifact {wandb_artifact.name}, found {len(names)}")
+
+    return wandb_artifact.get_path(names[0]).download()
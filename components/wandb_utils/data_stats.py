@@ -0,0 +1,182 @@
+import json
+import logging
+
+import numpy as np
+
+from wandb_utils.artifact_io import use_table
+from wandb_utils.schema import LISTING_SCHEMA
+from wandb_utils.sketch import KLLSketch
+
+
+logger = logging.getLogger(__name__)
+
+
+# Name of the statistics sidecar file stored next to a table in its artifact
+STATS_FILENAME = "statistics.json"
+
+# Columns of the listings dataset summarized by default
+LISTING_CATEGORICAL = ["neighbourhood_group", "neighbourhood", "room_type"]
+LISTING_NUMERIC = [
+    "price",
+    "minimum_nights",
+    "number_of_reviews",
+    "reviews_per_month",
+    "calculated_host_listings_count",
+    "availability_365",
+    "latitude",
+    "longitude",
+]
+
+
+class DatasetStats:
+    """
+    Compact, mergeable statistics of a table: row count, frequencies of the categorical columns,
+    and count, missing values, min, max and a quantile sketch (see KLLSketch) of the numeric columns.
+
+    The statistics can be computed chunk by chunk with update, and serialized to a small JSON file
+    (see save and load) that also contains a histogram of each numeric column.
+
+    :param categorical: categorical columns to summarize
+    :param numeric: numeric columns to summarize
+    :param k: size parameter of the quantile sketches
+    """
+
+    def __init__(self, categorical=LISTING_CATEGORICAL, numeric=LISTING_NUMERIC, k=200):
+        self.n_rows = 0
+        self.frequencies = {c: {} for c in categorical}
+        self.numeric = {
+            c: {"count": 0, "missing": 0, "min": np.inf, "max": -np.inf, "sketch": KLLSketch(k=k)}
+            for c in numeric
+        }
+
+    def update(self, df):
+        """
+        Add the rows of df to the statistics
+        """
+        self.n_rows += len(df)
+
+        for column, frequencies in self.frequencies.items():
+            # Categorical columns also count the categories absent from df (as 0)
+            for value, count in df[column].value_counts().items():
+                if count == 0:
+                    continue
+                frequencies[str(value)] = frequencies.get(str(value), 0) + int(count)
+
+        for column, stats in self.numeric.items():
+            values = df[column].to_numpy(dtype=float)
+            missing = np.isnan(values)
+            values = values[~missing]
+
+            stats["count"] += len(values)
+            stats["missing"] += int(missing.sum())
+            if len(values) > 0:
+                stats["min"] = min(stats["min"], float(values.min()))
+                stats["max"] = max(stats["max"], float(values.max()))
+            stats["sketch"].update(values)
+
+        return self
+
+    def merge(self, other):
+        """
+        Add the statistics of another table (with the same columns) to these
+        """
+        self.n_rows += other.n_rows
+
+        for column, frequencies in other.frequencies.items():
+            for value, count in frequencies.items():
+                self.frequencies[column][value] = self.frequencies[column].get(value, 0) + count
+
+        for column, stats in other.numeric.items():
+            mine = self.numeric[column]
+            mine["count"] += stats["count"]
+            mine["missing"] += stats["missing"]
+            mine["min"] = min(mine["min"], stats["min"])
+            mine["max"] = max(mine["max"], stats["max"])
+            mine["sketch"].merge(stats["sketch"])
+
+        return self
+
+    def histogram(self, column, bins=20):
+        """
+        Approximate histogram of a numeric column with equally-spaced bins between its min and max
+
+        :return: bin edges and counts
+        """
+        stats = self.numeric[column]
+        if stats["count"] == 0:
+            return [], []
+
+        edges = np.linspace(stats["min"], stats["max"], bins + 1)
+        cdf = stats["sketch"].cdf(edges)
+        cdf[0] = 0.0
+        counts = np.round(np.diff(cdf) * stats["count"]).astype(int)
+
+        return edges.tolist(), counts.tolist()
+
+    def to_dict(self):
+        numeric = {}
+        for column, stats in self.numeric.items():
+            edges, counts = self.histogram(column)
+            numeric[column] = {
+                "count": stats["count"],
+                "missing": stats["missing"],
+                "min": stats["min"] if stats["count"] > 0 else None,
+                "max": stats["max"] if stats["count"] > 0 else None,
+                "quantiles": stats["sketch"].quantile([0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]).tolist(),
+                "histogram": {"edges": edges, "counts": counts},
+                "sketch": stats["sketch"].to_dict(),
+            }
+
+        return {
+            "n_rows": self.n_rows,
+            "frequencies": self.frequencies,
+            "numeric": numeric,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(categorical=list(d["frequencies"]), numeric=list(d["numeric"]))
+        stats.n_rows = d["n_rows"]
+        stats.frequencies = {c: dict(f) for c, f in d["frequencies"].items()}
+
+        for column, s in d["numeric"].items():
+            stats.numeric[column] = {
+                "count": s["count"],
+                "missing": s["missing"],
+                "min": s["min"] if s["min"] is not None else np.inf,
+                "max": s["max"] if s["max"] is not None else -np.inf,
+                "sketch": KLLSketch.from_dict(s["sketch"]),
+            }
+
+        return stats
+
+    def save(self, path):
+        with open(path, "w+") as fp:
+            json.dump(self.to_dict(), fp)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fp:
+            return cls.from_dict(json.load(fp))
+
+
+def use_stats(wandb_run, artifact, **kwargs):
+    """
+    Declare that wandb_run uses the provided artifact and return its statistics. Only the statistics
+    sidecar (STATS_FILENAME) is downloaded. If the artifact does not have one, the table is
+    downloaded and the statistics are computed from it
+
+    :param wandb_run: current Weights & Biases run
+    :param artifact: artifact name, with an optional alias (for example "clean_sample.csv:reference")
+    :param kwargs: arguments for DatasetStats, used if the statistics need to be computed
+    :return: a DatasetStats instance
+    """
+    wandb_artifact = wandb_run.use_artifact(artifact)
+
+    try:
+        path = wandb_artifact.get_path(STATS_FILENAME).download()
+    except KeyError:
+        logger.info(f"{artifact} has no statistics sidecar, computing statistics from the table")
+        return DatasetStats(**kwargs).update(use_table(wandb_run, artifact, schema=LISTING_SCHEMA))
+
+    return DatasetStats.load(path)
@@ -0,0 +1,57 @@
+"""
+Column types of the listings dataset. The tables are read with these types in every step (see the
+schema parameter of read_table and use_table), instead of the int64, float64 and object columns
+inferred by pandas:
+
+* categorical for the columns with few distinct values
+* float32 for the coordinates, the price and the rates
+* int32 for the counts
+* int64 for the identifiers, which can grow beyond the int32 range
+
+The free text and date columns (name, host_name, last_review) keep the type inferred by pandas
+"""
+import pandas as pd
+
+
+LISTING_SCHEMA = {
+    "id": "int64",
+    "host_id": "int64",
+    "neighbourhood_group": "category",
+    "neighbourhood": "category",
+    "room_type": "category",
+    "latitude": "float32",
+    "longitude": "float32",
+    "price": "float32",
+    "reviews_per_month": "float32",
+    "minimum_nights": "int32",
+    "number_of_reviews": "int32",
+    "calculated_host_listings_count": "int32",
+    "availability_365": "int32",
+}
+
+
+def schema_for(schema, columns):
+    """
+    Restrict a schema (dictionary column -> dtype) to the provided columns (all of them if None)
+    """
+    if columns is None:
+        return dict(schema)
+
+    return {c: dtype for c, dtype in schema.items() if c in columns}
+
+
+def apply_schema(df, schema):
+    """
+    Cast the columns of df to the types of the schema. Columns not in the schema, and schema
+    columns not in df, are left alone. Columns that already have the right type are not copied
+
+    :param df: a DataFrame
+    :param schema: dictionary column -> dtype
+    :return: the DataFrame with the declared types
+    """
+    casts = {
+        c: dtype for c, dtype in schema_for(schema, df.columns).items()
+        if not (dtype == "category" and isinstance(df[c].dtype, pd.CategoricalDtype)) and df[c].dtype != dtype
+    }
+
+    return df.astype(casts) if casts else df
@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang, Liberty, "Optimal Quantile Approximation in Streams").
+
+    The sketch keeps a small number of items (O(k) regardless of the number of values added), each
+    representing 2 ** level of the original values. It can be updated chunk by chunk and two
+    sketches can be merged, so it can summarize datasets larger than memory.
+
+    :param k: size of the largest compactor. The rank error is approximately 1.65 / k
+    :param seed: seed for the random choices made during the compactions
+    """
+
+    _c = 2.0 / 3.0
+
+    def __init__(self, k=200, seed=42):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """
+        Add values to the sketch. Missing values are ignored
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+        return self
+
+    def merge(self, other):
+        """
+        Add the content of another sketch (with the same k) to this one
+        """
+        if other.k != self.k:
+            raise ValueError("Cannot merge sketches with different k")
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+
+        self.n += other.n
+        self._compress()
+
+        return self
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * self._c ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                items = np.sort(items)
+                # With an odd number of items one of them stays at this level
+                keep = items[len(items) - len(items) % 2:]
+                offset = self._rng.integers(2)
+                promoted = items[offset:len(items) - len(items) % 2:2]
+
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+            level += 1
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def cdf(self, x):
+        """
+        Approximate fraction of the values smaller than or equal to x (x can be an array)
+        """
+        items, weights = self._weighted_items()
+        if len(items) == 0:
+            return np.full(np.shape(x), np.nan)
+
+        cumulative = np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum()
+        return cumulative[np.searchsorted(items, x, side="right")]
+
+    def quantile(self, q):
+        """
+        Approximate q-quantile of the values (q can be an array)
+        """
+        items, weights = self._weighted_items()
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan)
+
+        cumulative = np.cumsum(weights) / weights.sum()
+        idx = np.searchsorted(cumulative, q, side="left")
+        return items[np.minimum(idx, len(items) - 1)]
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "levels": [v.tolist() for v in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(k=d["k"])
+        sketch.n = d["n"]
+        sketch.levels = [np.asarray(v, dtype=float) for v in d["levels"]]
+        return sketch
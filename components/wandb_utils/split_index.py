@@ -0,0 +1,119 @@
+"""
+Splits of a dataset stored as row indices instead of copies of the rows. A split artifact contains
+int32 arrays of positions in one base table (for example clean_sample.csv), so the steps read the
+base table once and select the rows of each subset from it
+"""
+import json
+import os
+
+import numpy as np
+
+
+# Name of the metadata file of a split, next to one ROWS_EXTENSION file per subset
+SPLIT_FILENAME = "split.json"
+ROWS_EXTENSION = ".npy"
+FOLDS_FILENAME = "folds.npy"
+
+
+class SplitIndex:
+    """
+    Subsets of the rows of a base table, and optional cross-validation folds of the trainval subset
+
+    :param n_rows: number of rows of the base table
+    :param subsets: dictionary subset name -> positions of its rows in the base table
+    :param folds: None, or array (n_repeats, len(subsets["trainval"])) with the fold of each trainval
+                  row in each repetition of the cross-validation
+    :param metadata: JSON-serializable dictionary saved with the split (for example the parameters
+                     of the split and the digest of the base table artifact)
+    """
+
+    def __init__(self, n_rows, subsets, folds=None, metadata=None):
+        self.n_rows = n_rows
+        self.subsets = {name: np.asarray(rows, dtype=np.int32) for name, rows in subsets.items()}
+        self.folds = folds
+        self.metadata = metadata or {}
+
+    @property
+    def n_splits(self):
+        return 0 if self.folds is None else int(self.folds.max()) + 1
+
+    @property
+    def n_repeats(self):
+        return 0 if self.folds is None else len(self.folds)
+
+    def fold(self, fold, repeat=0):
+        """
+        Training and validation rows of a fold of the trainval subset
+
+        :param fold: index of the fold used for validation
+        :param repeat: index of the repetition of the cross-validation
+        :return: positions in the base table of the training rows, and of the validation rows
+        """
+        if self.folds is None:
+            raise ValueError("The split has no cross-validation folds")
+        if not (0 <= fold < self.n_splits and 0 <= repeat < self.n_repeats):
+            raise ValueError(f"No fold {fold} of repetition {repeat}: the split has {self.n_splits} folds "
+                             f"and {self.n_repeats} repetitions")
+
+        trainval = self.subsets["trainval"]
+        is_val = self.folds[repeat] == fold
+        return trainval[~is_val], trainval[is_val]
+
+    def take(self, df, name):
+        """
+        Rows of the subset name of the base table df, in the order of the split
+        """
+        if len(df) != self.n_rows:
+            raise ValueError(f"The split is for a table of {self.n_rows} rows, got {len(df)} rows")
+
+        return df.iloc[self.subsets[name]]
+
+    def save(self, path):
+        """
+        Save the split into the directory path (created if needed)
+        """
+        os.makedirs(path, exist_ok=True)
+
+        for name, rows in self.subsets.items():
+            np.save(os.path.join(path, name + ROWS_EXTENSION), rows)
+        if self.folds is not None:
+            np.save(os.path.join(path, FOLDS_FILENAME), self.folds)
+
+        with open(os.path.join(path, SPLIT_FILENAME), "w") as fp:
+            json.dump({"n_rows": self.n_rows, "subsets": list(self.subsets), "metadata": self.metadata}, fp)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a split saved with save. With mmap, the arrays are memory-mapped instead of read
+        """
+        with open(os.path.join(path, SPLIT_FILENAME)) as fp:
+            split = json.load(fp)
+
+        mmap_mode = "r" if mmap else None
+        subsets = {name: np.load(os.path.join(path, name + ROWS_EXTENSION), mmap_mode=mmap_mode)
+                   for name in split["subsets"]}
+        folds_path = os.path.join(path, FOLDS_FILENAME)
+        folds = np.load(folds_path, mmap_mode=mmap_mode) if os.path.exists(folds_path) else None
+
+        return cls(split["n_rows"], subsets, folds, split["metadata"])
+
+
+def use_split(wandb_run, artifact, base_artifact=None):
+    """
+    Declare that wandb_run uses the provided split artifact and load it
+
+    :param wandb_run: current Weights & Biases run
+    :param artifact: the split artifact, with an optional alias (for example "data_split:latest")
+    :param base_artifact: optional name of the base table artifact. The split must have been made
+                          on this version of it
+    :return: a SplitIndex
+    """
+    split = SplitIndex.load(wandb_run.use_artifact(artifact).download())
+
+    if base_artifact is not None:
+        base_digest = wandb_run.use_artifact(base_artifact).digest
+        if split.metadata.get("base_digest") != base_digest:
+            raise ValueError(f"{artifact} was not made on {base_artifact}: split the data again")
+
+    return split
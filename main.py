@@ -1,17 +1,19 @@
 import json
-import mlflow
 import tempfile
 import os
 import wandb
 import hydra
-import subprocess
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
+
+from pipeline.cache import CachingExecutor
+from pipeline.dag import Step, run_steps
+from pipeline.executors import get_executor
 
 _steps = [
     "download",
     "basic_cleaning",
     "data_check",
-    "data_split",
+    "train_val_test_split",
     "train_random_forest",
     # NOTE: We do not include this in the steps so it is not run by mistake.
     # You first need to promote a model export to "prod" before you can run this,
@@ -32,91 +34,186 @@ def go(config: DictConfig):
     steps_par = config['main']['steps']
     active_steps = steps_par.split(",") if steps_par != "all" else _steps
 
+    # Either run each step in its own MLflow project and conda environment, or all of them
+    # in this process
+    executor = get_executor(
+        config["main"]["executor"],
+        os.path.join(hydra.utils.get_original_cwd(), "components")
+    )
+
+    # Skip the steps whose code, parameters and input artifacts did not change since a
+    # previous execution
+    if config["main"]["cache"]["enabled"]:
+        executor = CachingExecutor(
+            executor,
+            config["main"]["cache"]["dir"],
+            config["main"]["cache"]["max_size_mb"] * 1024 ** 2,
+            config["main"]["project_name"]
+        )
+
+    components_repository = _components_repository(config["main"]["components_repository"])
+    # The upstream components do not accept the parameters added by the local ones
+    local_components = os.path.isdir(components_repository)
+
+    # Whether the splits are logged as row indices of clean_sample.csv instead of copies of the rows
+    split_index = config["modeling"]["split"]["mode"] == "index"
+    if split_index and not local_components:
+        raise ValueError("modeling.split.mode index needs the local components (main.components_repository)")
+
     # Move to a temporary directory
     with tempfile.TemporaryDirectory() as tmp_dir:
 
-        if "download" in active_steps:
+        steps = [
             # Download file and load in W&B
-            _ = mlflow.run(
-                f"{config['main']['components_repository']}/get_data",
-                "main",
+            Step(
+                "download",
+                f"{components_repository}/get_data",
                 parameters={
                     "sample": config["etl"]["sample"],
                     "artifact_name": "sample.csv",
                     "artifact_type": "raw_data",
                     "artifact_description": "Raw file as downloaded"
                 },
-            )
-
-        if "basic_cleaning" in active_steps:
-             _ = mlflow.run(
-            os.path.join(hydra.utils.get_original_cwd(), "src", "basic_cleaning"),
-            "main",
-            parameters={
-                "input_artifact": "sample.csv:latest",
-                "output_artifact": "clean_sample.csv",
-                "output_type": "clean_sample",
-                "output_description": "Data with outliers and null values removed",
-                "min_price": config['etl']['min_price'],
-                "max_price": config['etl']['max_price']
-            },
-        )
-
-        if "data_check" in active_steps:
-            _ = mlflow.run(
-                    os.path.join(hydra.utils.get_original_cwd(), "src", "data_check"),
-                    "main",
-                    parameters={
-                        "csv": "clean_sample.csv:latest",
-                        "ref": "clean_sample.csv:reference",
-                        "min_price": config["etl"]["min_price"],
-                        "max_price": config["etl"]["max_price"],
-                        "kl_threshold": config["data_check"]["kl_threshold"]
-                    },
-                )
-
-        if "train_val_test_split" in active_steps:
-            _ = mlflow.run(
-                f"{config.main.components_repository}/train_val_test_split",
+                outputs=["sample.csv"],
+            ),
+            Step(
+                "basic_cleaning",
+                os.path.join(hydra.utils.get_original_cwd(), "src", "basic_cleaning"),
+                parameters={
+                    "input_artifact": "sample.csv:latest",
+                    "output_artifact": "clean_sample.csv",
+                    "output_type": "clean_sample",
+                    "output_description": "Data with outliers and null values removed",
+                    "min_price": config['etl']['min_price'],
+                    "max_price": config['etl']['max_price'],
+                    "rules": _write_json_config(config['etl']['cleaning_rules'], "cleaning_rules.json"),
+                    "output_format": config['etl']['artifact_format'],
+                    "chunksize": config['etl']['chunksize']
+                },
+                inputs=["sample.csv:latest"],
+                outputs=["clean_sample.csv"],
+            ),
+            Step(
+                "data_check",
+                os.path.join(hydra.utils.get_original_cwd(), "src", "data_check"),
+                parameters={
+                    "csv": "clean_sample.csv:latest",
+                    "ref": "clean_sample.csv:reference",
+                    "min_price": config["etl"]["min_price"],
+                    "max_price": config["etl"]["max_price"],
+                    "drift_config": _write_json_config(config["data_check"]["drift"], "drift_config.json")
+                },
+                inputs=["clean_sample.csv:latest", "clean_sample.csv:reference"],
+            ),
+            Step(
+                "train_val_test_split",
+                f"{components_repository}/train_val_test_split",
                 parameters={
                     "input": "clean_sample.csv:latest",
                     "test_size": str(config.modeling.test_size),
                     "random_seed": str(config.modeling.random_seed),
                     "stratify_by": config.modeling.stratify_by,
+                    **({
+                        "output_format": config.etl.artifact_format,
+                        "split_mode": config.modeling.split.mode,
+                        "n_splits": str(config.modeling.split.n_splits),
+                        "n_repeats": str(config.modeling.split.n_repeats),
+                    } if local_components else {}),
                 },
-            )
-
-        if "train_random_forest" in active_steps:
-            # Flatten rf_config
-            rf_config = dict(config["modeling"]["random_forest"].items())
-
-        
-
-            # Serialize RandomForest configuration to rf_config.json
-            rf_config_path = os.path.abspath("rf_config.json")
-            with open(rf_config_path, "w+") as fp:
-                json.dump(rf_config, fp)
-
-            # Execute train_random_forest/run.py using subprocess
-            subprocess.run([
-                "python", os.path.join(hydra.utils.get_original_cwd(), "src", "train_random_forest", "run.py"),
-                "--trainval_artifact", "clean_sample.csv:latest",
-                "--val_size", str(config.modeling.test_size),
-                "--random_seed", str(config.modeling.random_seed),
-                "--stratify_by", config.modeling.stratify_by,
-                "--rf_config", rf_config_path,
-                "--max_tfidf_features", str(config.modeling.max_tfidf_features),
-                "--output_artifact", "random_forest_export"
-            ])
-        if "test_regression_model" in active_steps:
-            _ = mlflow.run(
-                f"{config.main.components_repository}/test_regression_model",
+                inputs=["clean_sample.csv:latest"],
+                outputs=["data_split"] if split_index else ["trainval_data.csv", "test_data.csv"],
+            ),
+            # Executed in the current environment (without conda). We do not train on data
+            # that did not pass the checks
+            Step(
+                "train_random_forest",
+                os.path.join(hydra.utils.get_original_cwd(), "src", "train_random_forest"),
+                parameters={
+                    "trainval_artifact": "clean_sample.csv:latest",
+                    "val_size": str(config.modeling.test_size),
+                    "random_seed": str(config.modeling.random_seed),
+                    "stratify_by": config.modeling.stratify_by,
+                    "split_artifact": "data_split:latest" if split_index else "none",
+                    "fold": str(config.modeling.split.fold),
+                    "repeat": str(config.modeling.split.repeat),
+                    "estimator": config["modeling"]["estimator"],
+                    "rf_config": _write_json_config(
+                        config["modeling"][config["modeling"]["estimator"]], "rf_config.json"
+                    ),
+                    "max_tfidf_features": str(config.modeling.max_tfidf_features),
+                    "tfidf_config": _write_json_config(config["modeling"]["tfidf"], "tfidf_config.json"),
+                    "feature_layout": config.modeling.feature_layout.layout,
+                    "max_dense_mb": str(config.modeling.feature_layout.max_dense_mb),
+                    "feature_cache_dir": config.modeling.feature_cache_dir or "none",
+                    "feature_cache_max_size_mb": str(config.modeling.feature_cache_max_size_mb),
+                    "sweep_config": _write_json_config(config["modeling"]["sweep"], "sweep_config.json")
+                    if config["modeling"]["sweep"]["enabled"] else "none",
+                    "growth_config": _write_json_config(config["modeling"]["growth"], "growth_config.json")
+                    if config["modeling"]["growth"]["enabled"] else "none",
+                    "warm_start_model": config["modeling"]["growth"]["warm_start_model"] or "none",
+                    "fast_config": _write_json_config(config["modeling"]["fast"], "fast_config.json")
+                    if config["modeling"]["fast"]["enabled"] else "none",
+                    "export_flat_forest": str(
+                        config["modeling"]["export_flat_forest"] and config["modeling"]["estimator"] == "random_forest"
+                    ).lower(),
+                    "output_artifact": "random_forest_export"
+                },
+                use_conda=False,
+                inputs=["clean_sample.csv:latest"] + (["data_split:latest"] if split_index else []) + (
+                    [config["modeling"]["growth"]["warm_start_model"]]
+                    if config["modeling"]["growth"]["warm_start_model"] else []
+                ),
+                outputs=["random_forest_export"],
+                after=["data_check"],
+            ),
+            Step(
+                "test_regression_model",
+                f"{components_repository}/test_regression_model",
                 parameters={
                     "mlflow_model": "random_forest_export:prod",
-                    "test_dataset": "test_data.csv:latest"
+                    # With split_mode index, the test rows are selected from the cleaned data
+                    "test_dataset": "clean_sample.csv:latest" if split_index else "test_data.csv:latest",
+                    **({
+                        "split_artifact": "data_split:latest" if split_index else "none",
+                        # The flat export is for online scoring: it is slower on the whole test set
+                        "use_flat_forest": "false",
+                    } if local_components else {}),
                 },
-            )
+                inputs=["random_forest_export:prod"] + (
+                    ["clean_sample.csv:latest", "data_split:latest"] if split_index else ["test_data.csv:latest"]
+                ),
+            ),
+        ]
+
+        # Run the selected steps, in parallel when they do not depend on each other
+        run_steps(
+            [step for step in steps if step.name in active_steps],
+            executor,
+            max_workers=config["main"]["max_workers"]
+        )
+
+
+def _components_repository(repository):
+    """
+    Return the URI of the components: a remote repository as is, or the absolute path of a local
+    directory given relative to the root of the project
+    """
+    if "://" in repository:
+        return repository
+
+    return os.path.join(hydra.utils.get_original_cwd(), repository)
+
+
+def _write_json_config(section, filename):
+    """
+    Serialize a section of the configuration (for example the RandomForest configuration) to a JSON
+    file, and return its path
+    """
+    config_path = os.path.abspath(filename)
+    with open(config_path, "w+") as fp:
+        json.dump(OmegaConf.to_container(section, resolve=True), fp)
 
+    return config_path
 
 if __name__ == "__main__":
     go()
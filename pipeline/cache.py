@@ -0,0 +1,204 @@
+"""
+Content-addressed cache of pipeline steps
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import wandb
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachingExecutor:
+    """
+    Wrap an executor so that a step is skipped when it already ran with the same code, the same
+    parameters and the same input artifacts. On a hit, the versions of the output artifacts produced
+    by the previous execution are tagged again as "latest", so the following steps use them.
+
+    Each cache entry is a directory named after the cache key, containing a manifest with the output
+    artifact versions and a local copy of the output files. When the total size of the cache exceeds
+    max_size_bytes, the least recently used entries are removed.
+
+    :param executor: the executor actually running the steps
+    :param cache_dir: local directory for the cache entries
+    :param max_size_bytes: maximum total size of the cache directory
+    :param project: W&B project containing the artifacts
+    """
+
+    def __init__(self, executor, cache_dir, max_size_bytes, project):
+        self.executor = executor
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size_bytes = max_size_bytes
+        self.project = project
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Steps can complete concurrently (see pipeline.dag)
+        self._lock = threading.Lock()
+
+    @property
+    def parallel(self):
+        return getattr(self.executor, "parallel", True)
+
+    def run(self, uri, entry_point="main", parameters=None, use_conda=True, inputs=(), outputs=()):
+        parameters = parameters or {}
+
+        key = self._key(uri, entry_point, parameters, inputs)
+        if key is None:
+            return self.executor.run(
+                uri, entry_point, parameters=parameters, use_conda=use_conda, inputs=inputs, outputs=outputs
+            )
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry_dir, "manifest.json")
+
+        if os.path.exists(manifest_path):
+            logger.info(f"Cache hit for {uri} ({key}), skipping execution")
+            self._restore(manifest_path)
+            return None
+
+        result = self.executor.run(
+            uri, entry_point, parameters=parameters, use_conda=use_conda, inputs=inputs, outputs=outputs
+        )
+
+        with self._lock:
+            self._store(entry_dir, manifest_path, outputs)
+            self._evict()
+
+        return result
+
+    def _key(self, uri, entry_point, parameters, inputs):
+        """
+        Return the cache key of a step execution, or None if the step cannot be cached because one
+        of its inputs does not exist yet
+        """
+        digest = hashlib.sha256()
+        digest.update(self.project.encode())
+        # Hash the code that is actually going to run (the inline executor uses local copies)
+        resolve = getattr(self.executor, "resolve", None)
+        digest.update(_code_digest(resolve(uri) if resolve is not None else uri).encode())
+        digest.update(entry_point.encode())
+
+        resolved = {}
+        for k, v in parameters.items():
+            # Configuration files are written to a different path at every run: use their content
+            if isinstance(v, str) and os.path.isfile(v):
+                v = _file_digest(v)
+            resolved[k] = str(v)
+        digest.update(json.dumps(resolved, sort_keys=True).encode())
+
+        api = wandb.Api()
+        for artifact in sorted(inputs):
+            try:
+                digest.update(api.artifact(f"{self.project}/{artifact}").digest.encode())
+            except Exception:
+                logger.info(f"Input artifact {artifact} not found, the step will not be cached")
+                return None
+
+        return digest.hexdigest()
+
+    def _store(self, entry_dir, manifest_path, outputs):
+        api = wandb.Api()
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(entry_dir)
+
+        manifest = {}
+        for name in outputs:
+            artifact = api.artifact(f"{self.project}/{name}:latest")
+            artifact.download(root=os.path.join(entry_dir, "files", name))
+            manifest[name] = artifact.version
+
+        # The manifest is written last, so an interrupted entry is never considered a hit
+        with open(manifest_path, "w+") as fp:
+            json.dump(manifest, fp)
+
+    def _restore(self, manifest_path):
+        # The modification time of the manifest is the last access time used for eviction
+        os.utime(manifest_path)
+
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+
+        api = wandb.Api()
+        for name, version in manifest.items():
+            artifact = api.artifact(f"{self.project}/{name}:{version}")
+            if "latest" not in artifact.aliases:
+                artifact.aliases.append("latest")
+                artifact.save()
+
+            _share_cached_tables(name, os.path.join(os.path.dirname(manifest_path), "files", name))
+
+    def _evict(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            manifest_path = os.path.join(self.cache_dir, key, "manifest.json")
+            if os.path.exists(manifest_path):
+                entries.append((os.path.getmtime(manifest_path), key))
+
+        sizes = {key: _dir_size(os.path.join(self.cache_dir, key)) for _, key in entries}
+        total = sum(sizes.values())
+
+        for _, key in sorted(entries):
+            if total <= self.max_size_bytes:
+                break
+
+            logger.info(f"Evicting cache entry {key}")
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= sizes[key]
+
+
+def _share_cached_tables(artifact_name, files_dir):
+    """
+    If the pipeline keeps tables in memory (inline executor), load the cached copy of a table
+    artifact so the following steps do not need to download it
+    """
+    try:
+        from wandb_utils import artifact_io
+    except ImportError:
+        return
+
+    if not artifact_io.memory_store_enabled() or not os.path.isdir(files_dir):
+        return
+
+    tables = [f for f in os.listdir(files_dir) if os.path.splitext(f)[1] in artifact_io.FORMATS.values()]
+    if len(tables) == 1:
+        artifact_io.share_table(artifact_name, artifact_io.read_table(os.path.join(files_dir, tables[0])))
+
+
+def _code_digest(uri):
+    """
+    Digest of the code of a step. For remote steps the URI (including the git reference) is used
+    """
+    if not os.path.isdir(uri):
+        return uri
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(uri):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, uri).encode())
+            digest.update(_file_digest(path).encode())
+
+    return digest.hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+    )
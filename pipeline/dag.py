@@ -0,0 +1,116 @@
+"""
+Declaration of the pipeline steps as a dependency graph, and a scheduler running them
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Step:
+    """
+    A step of the pipeline
+
+    :param name: name of the step, as used in main.steps
+    :param uri: MLflow project of the step (local directory or remote URI)
+    :param parameters: parameters of the entry point
+    :param entry_point: entry point of the MLflow project to run
+    :param use_conda: whether to run the step in its own conda environment
+    :param inputs: artifacts read by the step (name:alias)
+    :param outputs: names of the artifacts written by the step
+    :param after: names of steps that must complete before this one, in addition to the producers
+                  of its inputs (for example a validation step)
+    """
+    name: str
+    uri: str
+    parameters: dict
+    entry_point: str = "main"
+    use_conda: bool = True
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    after: list = field(default_factory=list)
+
+
+def dependencies(steps):
+    """
+    Return a dictionary step name -> set of names of the steps it depends on. A step depends on the
+    steps producing the latest version of one of its inputs, and on the steps listed in its after
+    attribute. Only the provided steps are considered: the inputs produced by steps that are not
+    being executed are expected to exist already
+    """
+    producers = {output: step.name for step in steps for output in step.outputs}
+    names = {step.name for step in steps}
+
+    deps = {}
+    for step in steps:
+        deps[step.name] = {n for n in step.after if n in names}
+
+        for artifact in step.inputs:
+            name, _, alias = artifact.partition(":")
+            if alias in ("", "latest") and name in producers:
+                deps[step.name].add(producers[name])
+
+    return deps
+
+
+def run_steps(steps, executor, max_workers=1):
+    """
+    Run the steps with the provided executor, starting each step as soon as the steps it depends
+    on are completed. Up to max_workers independent steps run concurrently (executors that cannot
+    run steps concurrently, like the inline executor, always run one step at the time).
+
+    If a step fails no other step is started, and the exception is raised once the steps already
+    running are completed
+    """
+    if not getattr(executor, "parallel", True):
+        max_workers = 1
+
+    deps = dependencies(steps)
+    pending = {step.name: step for step in steps}
+    completed = set()
+    running = {}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        while pending or running:
+
+            if error is None:
+                ready = [s for s in pending.values() if deps[s.name] <= completed]
+
+                if not ready and not running:
+                    raise ValueError(f"Circular dependency between steps {', '.join(pending)}")
+
+                for step in ready:
+                    logger.info(f"Starting step {step.name}")
+                    del pending[step.name]
+                    future = pool.submit(
+                        executor.run,
+                        step.uri,
+                        step.entry_point,
+                        parameters=step.parameters,
+                        use_conda=step.use_conda,
+                        inputs=step.inputs,
+                        outputs=step.outputs,
+                    )
+                    running[future] = step.name
+
+            elif not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+
+                if future.exception() is not None:
+                    logger.error(f"Step {name} failed")
+                    error = error or future.exception()
+                else:
+                    logger.info(f"Step {name} completed")
+                    completed.add(name)
+
+    if error is not None:
+        raise error
@@ -0,0 +1,160 @@
+"""
+Executors used by main.py to run the steps of the pipeline
+"""
+import contextlib
+import logging
+import os
+import runpy
+import shlex
+import sys
+
+import mlflow
+import yaml
+from mlflow.exceptions import ExecutionException
+
+
+logger = logging.getLogger(__name__)
+
+
+class MlflowExecutor:
+    """
+    Run each step as a separate MLflow project, each one in its own conda environment.
+
+    The inputs and outputs arguments of run (the artifacts read and written by the step) are not
+    needed to execute the step, but are used by the wrappers of the executors (see pipeline.cache)
+    """
+
+    # Steps run in separate processes, so several of them can run at the same time
+    parallel = True
+
+    def run(self, uri, entry_point="main", parameters=None, use_conda=True, inputs=(), outputs=()):
+        return mlflow.run(uri, entry_point, parameters=parameters, use_conda=use_conda)
+
+
+class InlineExecutor:
+    """
+    Run each step in the current Python interpreter, by executing the command of its MLproject
+    entry point in-process. This avoids the creation of one conda environment and one interpreter
+    per step, and lets steps pass tables to each other in memory (see wandb_utils.artifact_io).
+
+    All the dependencies of the steps must be installed in the current environment.
+
+    :param components_dir: local directory containing the components. Steps referenced through
+                           the remote components repository are resolved in this directory
+    """
+
+    # Steps share the working directory, sys.argv and the W&B run of this process
+    parallel = False
+
+    def __init__(self, components_dir):
+        self.components_dir = os.path.abspath(components_dir)
+
+        # The components import wandb_utils, which lives in the components directory
+        if self.components_dir not in sys.path:
+            sys.path.insert(0, self.components_dir)
+
+        from wandb_utils.artifact_io import enable_memory_store
+        enable_memory_store()
+
+    def run(self, uri, entry_point="main", parameters=None, use_conda=True, inputs=(), outputs=()):
+        project_dir = self.resolve(uri)
+        argv = _entry_point_command(project_dir, entry_point, parameters or {})
+
+        logger.info(f"Running {project_dir} inline: {' '.join(argv)}")
+
+        with _step_context(project_dir, argv):
+            if argv[0] == "python":
+                _run_script(argv[1:])
+            elif argv[0] == "pytest":
+                _run_pytest(argv[1:])
+            else:
+                raise ExecutionException(f"Cannot run command {argv[0]} inline")
+
+    def resolve(self, uri):
+        """
+        Return the local directory of the step with the given URI
+        """
+        if os.path.isdir(uri):
+            return os.path.abspath(uri)
+
+        # Remote URIs have the form <repository>#<subdirectory>/<step>
+        local_dir = os.path.join(self.components_dir, uri.rstrip("/").split("/")[-1])
+        if not os.path.isdir(local_dir):
+            raise ExecutionException(f"Cannot find a local copy of {uri} in {self.components_dir}")
+
+        return local_dir
+
+
+def _entry_point_command(project_dir, entry_point, parameters):
+    """
+    Build the command of the given entry point of an MLproject file, substituting the parameters
+    (and their defaults) as MLflow would
+    """
+    with open(os.path.join(project_dir, "MLproject")) as fp:
+        project = yaml.safe_load(fp)
+
+    spec = project["entry_points"][entry_point]
+
+    values = {k: v.get("default") for k, v in (spec.get("parameters") or {}).items()}
+    values.update(parameters)
+
+    missing = [k for k, v in values.items() if v is None]
+    if missing:
+        raise ExecutionException(f"Missing values for parameters {', '.join(missing)}")
+
+    command = spec["command"].format(**{k: shlex.quote(str(v)) for k, v in values.items()})
+
+    # Line continuations are only meaningful to the shell
+    return shlex.split(command.replace("\\\n", " "))
+
+
+@contextlib.contextmanager
+def _step_context(project_dir, argv):
+    """
+    Execute the step from within its own directory, with its modules importable, and make sure its
+    W&B run is closed at the end so the next step starts a new one
+    """
+    import wandb
+
+    old_cwd = os.getcwd()
+    old_argv = sys.argv
+    sys.path.insert(0, project_dir)
+    os.chdir(project_dir)
+
+    try:
+        yield
+    finally:
+        wandb.finish()
+        os.chdir(old_cwd)
+        sys.argv = old_argv
+        sys.path.remove(project_dir)
+
+
+def _run_script(argv):
+    sys.argv = argv
+
+    try:
+        runpy.run_path(argv[0], run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise ExecutionException(f"{argv[0]} exited with code {e.code}")
+
+
+def _run_pytest(argv):
+    import pytest
+
+    exit_code = pytest.main(argv)
+    if exit_code != 0:
+        raise ExecutionException(f"pytest exited with code {exit_code}")
+
+
+def get_executor(name, components_dir):
+    """
+    Return the executor with the given name ("mlflow" or "inline")
+    """
+    if name == "mlflow":
+        return MlflowExecutor()
+    elif name == "inline":
+        return InlineExecutor(components_dir)
+    else:
+        raise ValueError(f"Unknown executor {name}. Use either mlflow or inline")
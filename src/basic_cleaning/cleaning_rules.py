@@ -0,0 +1,81 @@
+"""
+Declarative cleaning rules, compiled into a single boolean mask
+"""
+import numpy as np
+
+
+# Rules applied when no other rules are provided: drop rows with missing values and properties
+# outside of NYC
+DEFAULT_RULES = {
+    "no_missing_values": {"type": "not_null"},
+    "longitude_range": {"type": "range", "column": "longitude", "min": -74.25, "max": -73.50},
+    "latitude_range": {"type": "range", "column": "latitude", "min": 40.5, "max": 41.2},
+}
+
+
+def _range_predicate(column, min, max):
+    def predicate(df):
+        values = df[column].to_numpy()
+        # NaN values are outside of any range
+        return (values >= min) & (values <= max)
+
+    return predicate
+
+
+def _not_null_predicate(columns=None):
+    def predicate(df):
+        subset = df if columns is None else df[columns]
+        return subset.notna().to_numpy().all(axis=1)
+
+    return predicate
+
+
+_RULE_TYPES = {
+    "range": _range_predicate,
+    "not_null": _not_null_predicate,
+}
+
+
+def compile_rules(rules):
+    """
+    Compile a dictionary rule name -> rule specification into a list of (name, predicate). A rule
+    specification is a dictionary with a "type" and the parameters of the rule:
+
+    - range: keep the rows where "column" is between "min" and "max" (inclusive)
+    - not_null: keep the rows without missing values (optionally only in the list of "columns")
+
+    :param rules: the rules
+    :return: list of (name, predicate). Each predicate returns the boolean mask of the rows to keep
+    """
+    compiled = []
+    for name, spec in rules.items():
+        spec = dict(spec)
+        rule_type = spec.pop("type")
+
+        if rule_type not in _RULE_TYPES:
+            raise ValueError(f"Unknown type {rule_type} for rule {name}. Use one of {', '.join(_RULE_TYPES)}")
+
+        compiled.append((name, _RULE_TYPES[rule_type](**spec)))
+
+    return compiled
+
+
+def apply_rules(compiled, df):
+    """
+    Evaluate all the rules on df and combine them in a single mask, then select the rows passing
+    all the rules with one indexing operation (no intermediate copy of the data)
+
+    :param compiled: rules returned by compile_rules
+    :param df: the data
+    :return: the rows passing all the rules, and a dictionary rule name -> number of rows rejected
+             by the rule (a row can be rejected by more than one rule)
+    """
+    keep = np.ones(len(df), dtype=bool)
+    rejected = {}
+
+    for name, predicate in compiled:
+        mask = predicate(df)
+        rejected[name] = int(len(df) - np.count_nonzero(mask))
+        keep &= mask
+
+    return df[keep], rejected
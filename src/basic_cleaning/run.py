@@ -3,11 +3,19 @@
 Download from W&B the raw dataset and apply some basic data cleaning, exporting the result to a new artifact
 """
 import argparse
+import json
 import logging
 import wandb
-import pandas as pd
 import os
 
+from cleaning_rules import DEFAULT_RULES, apply_rules, compile_rules
+
+from wandb_utils.artifact_io import (
+    FORMATS, TableWriter, download_table, iter_table, share_table, table_filename, use_table, write_table
+)
+from wandb_utils.data_stats import STATS_FILENAME, DatasetStats
+from wandb_utils.schema import LISTING_SCHEMA
+
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
 logger = logging.getLogger()
@@ -21,34 +29,67 @@ def go(args):
 
 
 
-    # Download input artifact. This will also log that this script is using this
-    # particular version of the artifact
-    # artifact_local_path = run.use_artifact(args.input_artifact).file()
+    cleaned_data_path = table_filename("clean_sample", args.output_format)
+
+    # The price range is always applied, the other rules come from the configuration
+    rules = {"price_range": {"type": "range", "column": "price", "min": args.min_price, "max": args.max_price}}
+    if args.rules is not None:
+        with open(args.rules) as fp:
+            rules.update(json.load(fp))
+    else:
+        rules.update(DEFAULT_RULES)
+
+    run.config.update({"cleaning_rules": rules})
+    logger.info(f"Applying cleaning rules {', '.join(rules)}")
+    compiled = compile_rules(rules)
+    rejected = dict.fromkeys(rules, 0)
+
+    # Statistics of the cleaned data, stored next to it in the artifact. The data_check step compares
+    # new data with the statistics of the reference dataset, without downloading the dataset itself
+    stats = DatasetStats()
 
-    artifact_local_path = run.use_artifact(args.input_artifact).file()
-    logger.info(f"Downloaded input artifact to {artifact_local_path}")
+    if args.chunksize > 0:
+        # Streaming mode: only one chunk of the input is in memory at any time
+        artifact_local_path = download_table(run.use_artifact(args.input_artifact))
+        logger.info(f"Downloaded input artifact to {artifact_local_path}")
 
-    # Read the input data
-    df = pd.read_csv(artifact_local_path)
+        n_rows = 0
+        with TableWriter(cleaned_data_path, schema=LISTING_SCHEMA) as writer:
+            for chunk in iter_table(artifact_local_path, args.chunksize, schema=LISTING_SCHEMA):
+                n_rows += len(chunk)
+                chunk, chunk_rejected = apply_rules(compiled, chunk)
+                writer.write(chunk)
+                stats.update(chunk)
 
-    # Basic data cleaning: Remove outliers
-    min_price = args.min_price
-    max_price = args.max_price
+                for name, count in chunk_rejected.items():
+                    rejected[name] += count
 
-    logger.info(f"Removing outliers outside the range {min_price} to {max_price}")
-    df = df[df['price'].between(min_price, max_price)].copy()
+        logger.info(f"Kept {writer.n_rows} rows out of {n_rows}")
+        df = None
 
-    # Drop rows with missing values
-    logger.info("Dropping rows with missing values")
-    df.dropna(inplace=True)
+    else:
+        # Download and read the input artifact. This will also log that this script is using this
+        # particular version of the artifact
+        df = use_table(run, args.input_artifact, schema=LISTING_SCHEMA)
+        logger.info(f"Read input artifact {args.input_artifact}")
+
+        n_rows = len(df)
+        df, rejected = apply_rules(compiled, df)
+        logger.info(f"Kept {len(df)} rows out of {n_rows}")
+
+        write_table(df, cleaned_data_path, schema=LISTING_SCHEMA)
+        stats.update(df)
 
-    # Save cleaned data to a CSV file
-    cleaned_data_path = "clean_sample.csv"
-    idx = df['longitude'].between(-74.25, -73.50) & df['latitude'].between(40.5, 41.2)
-    df = df[idx].copy()
-    df.to_csv(cleaned_data_path, index=False)
     logger.info(f"Cleaned data saved to {cleaned_data_path}")
 
+    stats.save(STATS_FILENAME)
+
+    # Report how many rows each rule rejected
+    for name, count in rejected.items():
+        logger.info(f"Rule {name} rejected {count} rows")
+        run.summary[f"rejected_{name}"] = count
+    run.summary["n_rows_in"] = n_rows
+
     # Log the cleaned data to Weights & Biases
     artifact = wandb.Artifact(
         args.output_artifact,
@@ -56,7 +97,10 @@ def go(args):
         description=args.output_description,
     )
     artifact.add_file(cleaned_data_path)
+    artifact.add_file(STATS_FILENAME)
     run.log_artifact(artifact)
+    if df is not None:
+        share_table(args.output_artifact, df)
     logger.info("Cleaned data artifact logged to Weights & Biases")
 
 
@@ -107,6 +151,34 @@ if __name__ == "__main__":
         required=True
     )
 
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        help="Serialization format for the output artifact",
+        choices=list(FORMATS),
+        default="csv",
+        required=False
+    )
+
+    parser.add_argument(
+        "--rules",
+        type=str,
+        help="Path to a JSON file with the cleaning rules to apply in addition to the price range "
+             "(see cleaning_rules.compile_rules). By default, rows with missing values and properties "
+             "outside of NYC are removed",
+        default=None,
+        required=False
+    )
+
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="If larger than 0, process the input in chunks of this many rows instead of loading it "
+             "all in memory",
+        default=0,
+        required=False
+    )
+
 
     args = parser.parse_args()
 
@@ -1,56 +1,85 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-import pandas as pd
 import wandb
 
+from summaries import summarize
+from wandb_utils.artifact_io import use_table
+from wandb_utils.data_stats import use_stats
+from wandb_utils.schema import LISTING_SCHEMA
+
 
 def pytest_addoption(parser):
     parser.addoption("--csv", action="store")
     parser.addoption("--ref", action="store")
-    parser.addoption("--kl_threshold", action="store")
     parser.addoption("--min_price", action="store")
     parser.addoption("--max_price", action="store")
+    parser.addoption("--drift_config", action="store")
 
 
-@pytest.fixture(scope='session')
-def data(request):
-    run = wandb.init(job_type="data_tests", resume=True)
+def pytest_generate_tests(metafunc):
+    # One drift test for each column and metric in the drift configuration
+    if "drift_metric" in metafunc.fixturenames:
+        tests = []
 
-    # Download input artifact. This will also note that this script is using this
-    # particular version of the artifact
-    data_path = run.use_artifact(request.config.option.csv).file()
+        if metafunc.config.option.drift_config is not None:
+            with open(metafunc.config.option.drift_config) as fp:
+                drift_config = json.load(fp)
 
-    if data_path is None:
-        pytest.fail("You must provide the --csv option on the command line")
+            for column, thresholds in drift_config.items():
+                for metric, threshold in thresholds.items():
+                    tests.append((column, metric, float(threshold)))
 
-    df = pd.read_csv(data_path)
+        metafunc.parametrize(
+            "drift_column,drift_metric,drift_threshold", tests, ids=[f"{c}-{m}" for c, m, _ in tests]
+        )
 
-    return df
+
+@pytest.fixture(scope='session')
+def run():
+    return wandb.init(job_type="data_tests", resume=True)
 
 
 @pytest.fixture(scope='session')
-def ref_data(request):
-    run = wandb.init(job_type="data_tests", resume=True)
+def inputs(request, run):
 
-    # Download input artifact. This will also note that this script is using this
-    # particular version of the artifact
-    data_path = run.use_artifact(request.config.option.ref).file()
+    if request.config.option.csv is None:
+        pytest.fail("You must provide the --csv option on the command line")
 
-    if data_path is None:
+    if request.config.option.ref is None:
         pytest.fail("You must provide the --ref option on the command line")
 
-    df = pd.read_csv(data_path)
+    # Download the input artifacts concurrently. This will also note that this script is using
+    # these particular versions of the artifacts. Of the reference dataset we only need the
+    # precomputed statistics
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        data = pool.submit(use_table, run, request.config.option.csv, schema=LISTING_SCHEMA)
+        stats = pool.submit(use_stats, run, request.config.option.csv)
+        ref_stats = pool.submit(use_stats, run, request.config.option.ref)
 
-    return df
+        return data.result(), stats.result(), ref_stats.result()
 
 
 @pytest.fixture(scope='session')
-def kl_threshold(request):
-    kl_threshold = request.config.option.kl_threshold
+def data(inputs):
+    return inputs[0]
+
 
-    if kl_threshold is None:
-        pytest.fail("You must provide a threshold for the KL test")
+@pytest.fixture(scope='session')
+def stats(inputs):
+    return inputs[1]
+
+
+@pytest.fixture(scope='session')
+def ref_stats(inputs):
+    return inputs[2]
+
+
+@pytest.fixture(scope='session')
+def summary(data):
+    return summarize(data)
 
-    return float(kl_threshold)
 
 @pytest.fixture(scope='session')
 def min_price(request):
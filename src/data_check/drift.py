@@ -0,0 +1,94 @@
+"""
+Distribution drift metrics between a dataset and a reference, computed from their statistics
+(see wandb_utils.data_stats) so they never need the datasets themselves
+"""
+import numpy as np
+
+
+# Added to the frequencies of the categories, so a category missing from one of the two datasets
+# gives a large but finite divergence
+EPSILON = 1e-4
+
+
+def _aligned_distributions(freq, ref_freq):
+    categories = sorted(set(freq) | set(ref_freq))
+
+    p = np.array([freq.get(c, 0) for c in categories], dtype=float)
+    q = np.array([ref_freq.get(c, 0) for c in categories], dtype=float)
+
+    p = p / p.sum() + EPSILON
+    q = q / q.sum() + EPSILON
+
+    return p / p.sum(), q / q.sum()
+
+
+def kl_divergence(freq, ref_freq):
+    """
+    KL divergence (in bits) of the distribution of a categorical column from the reference one
+
+    :param freq: dictionary category -> count
+    :param ref_freq: dictionary category -> count for the reference dataset
+    """
+    p, q = _aligned_distributions(freq, ref_freq)
+    return float(np.sum(p * np.log2(p / q)))
+
+
+def psi(freq, ref_freq):
+    """
+    Population stability index of a categorical column with respect to the reference
+
+    :param freq: dictionary category -> count
+    :param ref_freq: dictionary category -> count for the reference dataset
+    """
+    p, q = _aligned_distributions(freq, ref_freq)
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+def ks_distance(sketch, ref_sketch):
+    """
+    Kolmogorov-Smirnov distance (maximum difference between the CDFs) of a numeric column from the
+    reference, estimated from their quantile sketches
+    """
+    points = np.union1d(np.concatenate(sketch.levels), np.concatenate(ref_sketch.levels))
+    return float(np.max(np.abs(sketch.cdf(points) - ref_sketch.cdf(points))))
+
+
+def wasserstein_distance(sketch, ref_sketch, n_points=200):
+    """
+    Wasserstein-1 distance (integral of the difference between the quantile functions) of a numeric
+    column from the reference, estimated from their quantile sketches. It has the same unit as the
+    column
+    """
+    q = (np.arange(n_points) + 0.5) / n_points
+    return float(np.mean(np.abs(sketch.quantile(q) - ref_sketch.quantile(q))))
+
+
+CATEGORICAL_METRICS = {
+    "kl": kl_divergence,
+    "psi": psi,
+}
+
+NUMERIC_METRICS = {
+    "ks": ks_distance,
+    "wasserstein": wasserstein_distance,
+}
+
+
+def drift(stats, ref_stats, column, metric):
+    """
+    Compute a drift metric for a column
+
+    :param stats: statistics of the dataset (DatasetStats)
+    :param ref_stats: statistics of the reference dataset (DatasetStats)
+    :param column: the column
+    :param metric: one of the keys of CATEGORICAL_METRICS (for categorical columns) or
+                   NUMERIC_METRICS (for numeric columns)
+    :return: the value of the metric
+    """
+    if metric in CATEGORICAL_METRICS:
+        return CATEGORICAL_METRICS[metric](stats.frequencies[column], ref_stats.frequencies[column])
+
+    if metric in NUMERIC_METRICS:
+        return NUMERIC_METRICS[metric](stats.numeric[column]["sketch"], ref_stats.numeric[column]["sketch"])
+
+    raise ValueError(f"Unknown drift metric {metric}")
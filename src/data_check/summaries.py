@@ -0,0 +1,43 @@
+"""
+Column summaries used by the data tests. They are computed once per dataset, so that the cost of
+the tests depends on the number of columns scanned and not on the number of tests
+"""
+import numpy as np
+
+
+# Longitude and latitude boundaries for properties in and around NYC
+LONGITUDE_RANGE = (-74.25, -73.50)
+LATITUDE_RANGE = (40.5, 41.2)
+
+
+def summarize(df):
+    """
+    Compute the summary of the columns of df needed by the tests, scanning each column once
+
+    :param df: the dataset
+    :return: a dictionary with the summary
+    """
+    longitude = df["longitude"].to_numpy()
+    latitude = df["latitude"].to_numpy()
+    in_bounds = (
+        (longitude >= LONGITUDE_RANGE[0]) & (longitude <= LONGITUDE_RANGE[1])
+        & (latitude >= LATITUDE_RANGE[0]) & (latitude <= LATITUDE_RANGE[1])
+    )
+
+    price = df["price"].to_numpy(dtype=float)
+
+    return {
+        "columns": list(df.columns),
+        "n_rows": len(df),
+        "neighbourhood_group_counts": _value_counts(df["neighbourhood_group"]),
+        "n_out_of_bounds": int(np.count_nonzero(~in_bounds)),
+        "price_min": np.nanmin(price) if len(price) else np.nan,
+        "price_max": np.nanmax(price) if len(price) else np.nan,
+        "price_n_missing": int(np.count_nonzero(np.isnan(price))),
+    }
+
+
+def _value_counts(column):
+    # Without the categories of a categorical column that are absent from the data
+    counts = column.value_counts()
+    return counts[counts > 0].sort_index()
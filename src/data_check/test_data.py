@@ -1,9 +1,7 @@
-import pandas as pd
-import numpy as np
-import scipy.stats
+from drift import drift
 
 
-def test_column_names(data):
+def test_column_names(summary):
 
     expected_colums = [
         "id",
@@ -24,44 +22,41 @@ def test_column_names(data):
         "availability_365",
     ]
 
-    these_columns = data.columns.values
+    these_columns = summary["columns"]
 
     # This also enforces the same order
     assert list(expected_colums) == list(these_columns)
 
 
-def test_neighborhood_names(data):
+def test_neighborhood_names(summary):
 
     known_names = ["Bronx", "Brooklyn", "Manhattan", "Queens", "Staten Island"]
 
-    neigh = set(data['neighbourhood_group'].unique())
+    neigh = set(summary["neighbourhood_group_counts"].index)
 
     # Unordered check
     assert set(known_names) == set(neigh)
 
 
-def test_proper_boundaries(data: pd.DataFrame):
+def test_proper_boundaries(summary):
     """
     Test proper longitude and latitude boundaries for properties in and around NYC
+    (see summaries.LONGITUDE_RANGE and summaries.LATITUDE_RANGE)
     """
-    idx = data['longitude'].between(-74.25, -73.50) & data['latitude'].between(40.5, 41.2)
+    assert summary["n_out_of_bounds"] == 0
 
-    assert np.sum(~idx) == 0
 
+def test_row_count(summary):
+    assert 15000 < summary["n_rows"] < 1000000
 
-def test_similar_neigh_distrib(data: pd.DataFrame, ref_data: pd.DataFrame, kl_threshold: float):
-    """
-    Apply a threshold on the KL divergence to detect if the distribution of the new data is
-    significantly different than that of the reference dataset
-    """
-    dist1 = data['neighbourhood_group'].value_counts().sort_index()
-    dist2 = ref_data['neighbourhood_group'].value_counts().sort_index()
-
-    assert scipy.stats.entropy(dist1, dist2, base=2) < kl_threshold
+def test_price_range(summary, min_price, max_price):
+    assert summary["price_n_missing"] == 0
+    assert min_price <= summary["price_min"] and summary["price_max"] <= max_price
 
 
-def test_row_count(data):
-    assert 15000 < data.shape[0] < 1000000
-
-def test_price_range(data, min_price, max_price):
-    assert data['price'].between(min_price, max_price).all()
+def test_distribution_drift(stats, ref_stats, drift_column, drift_metric, drift_threshold):
+    """
+    Compare the distribution of a column with the one in the reference dataset (see drift.py and
+    data_check.drift in config.yaml)
+    """
+    assert drift(stats, ref_stats, drift_column, drift_metric) < drift_threshold
@@ -0,0 +1,52 @@
+"""
+Registry of the estimators that can be trained at the end of the inference pipeline
+"""
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+
+def _random_forest(config, categorical_features):
+    return RandomForestRegressor(**config)
+
+
+def _hist_gradient_boosting(config, categorical_features):
+    # The categorical columns are ordinal-encoded and split natively, without one-hot encoding
+    return HistGradientBoostingRegressor(categorical_features=categorical_features, **config)
+
+
+# Name -> (function (config, categorical_features) -> estimator, whether the estimator handles the
+# ordinal-encoded categorical columns natively, whether it accepts sparse features).
+# categorical_features are the indices of those columns in the preprocessed features
+ESTIMATORS = {
+    "random_forest": (_random_forest, False, True),
+    "hist_gradient_boosting": (_hist_gradient_boosting, True, False),
+}
+
+
+def native_categorical(name):
+    """
+    Whether the estimator handles categorical columns natively (instead of needing one-hot encoding)
+    """
+    return ESTIMATORS[name][1]
+
+
+def accepts_sparse(name):
+    """
+    Whether the estimator can be fitted on sparse features
+    """
+    return ESTIMATORS[name][2]
+
+
+def build_estimator(name, config, categorical_features=None):
+    """
+    Build an estimator of the registry
+
+    :param name: one of the keys of ESTIMATORS
+    :param config: parameters for the constructor of the estimator
+    :param categorical_features: indices of the categorical columns in the preprocessed features,
+                                 used by the estimators that handle them natively
+    :return: the (unfitted) estimator
+    """
+    if name not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator {name}, expected one of {list(ESTIMATORS)}")
+
+    return ESTIMATORS[name][0](config, categorical_features)
@@ -0,0 +1,143 @@
+"""
+Persistent cache of the fitted preprocessing and of the feature matrices it produces
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+import scipy.sparse
+
+
+logger = logging.getLogger()
+
+
+def _save_matrix(path, X):
+    if scipy.sparse.issparse(X):
+        scipy.sparse.save_npz(path + ".npz", X.tocsr())
+    else:
+        np.save(path + ".npy", X)
+
+
+def _load_matrix(path):
+    if os.path.exists(path + ".npz"):
+        return scipy.sparse.load_npz(path + ".npz")
+
+    return np.load(path + ".npy")
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+    )
+
+def preprocessing_code_digest():
+    """
+    Digest of the source code of this step, so that changing the preprocessing invalidates the cache
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as fp:
+            digest.update(fp.read())
+
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Store the fitted preprocessor together with the transformed training and validation sets, so
+    that training runs that only change the model hyperparameters can skip the preprocessing.
+
+    Entries are keyed on the digest of the trainval artifact, the parameters of the split and the
+    preprocessing configuration (see key). When the total size of the cache exceeds max_size_bytes,
+    the least recently used entries are removed.
+
+    :param cache_dir: local directory for the cache entries
+    :param max_size_bytes: maximum total size of the cache directory
+    """
+
+    def __init__(self, cache_dir, max_size_bytes):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(trainval_digest, **params):
+        """
+        Cache key for the provided trainval artifact digest and the parameters of the split and of
+        the preprocessing
+        """
+        digest = hashlib.sha256()
+        digest.update(trainval_digest.encode())
+        digest.update(preprocessing_code_digest().encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Return (preprocessor, X_train, y_train, X_val, y_val, sample) for the key, or None on a
+        miss. sample is a few raw validation rows, to check the preprocessor without the data
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            return None
+
+        # The modification time of the entry directory is the last access time used for eviction
+        os.utime(entry_dir)
+
+        logger.info(f"Loading preprocessed features from {entry_dir}")
+        return (
+            joblib.load(os.path.join(entry_dir, "preprocessor.joblib")),
+            _load_matrix(os.path.join(entry_dir, "X_train")),
+            np.load(os.path.join(entry_dir, "y_train.npy")),
+            _load_matrix(os.path.join(entry_dir, "X_val")),
+            np.load(os.path.join(entry_dir, "y_val.npy")),
+            joblib.load(os.path.join(entry_dir, "sample.joblib")),
+        )
+
+    def save(self, key, preprocessor, X_train, y_train, X_val, y_val, sample):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_dir):
+            return
+
+        # Write to a temporary directory, then move it in place, so incomplete entries are never read
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        joblib.dump(preprocessor, os.path.join(tmp_dir, "preprocessor.joblib"))
+        _save_matrix(os.path.join(tmp_dir, "X_train"), X_train)
+        np.save(os.path.join(tmp_dir, "y_train.npy"), np.asarray(y_train))
+        _save_matrix(os.path.join(tmp_dir, "X_val"), X_val)
+        np.save(os.path.join(tmp_dir, "y_val.npy"), np.asarray(y_val))
+        joblib.dump(sample, os.path.join(tmp_dir, "sample.joblib"))
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another run stored the same entry in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            # Skip the temporary directories of the entries being written
+            if not key.startswith("tmp") and os.path.isdir(entry_dir):
+                entries.append((os.path.getmtime(entry_dir), key))
+
+        sizes = {key: _dir_size(os.path.join(self.cache_dir, key)) for _, key in entries}
+        total = sum(sizes.values())
+
+        for _, key in sorted(entries):
+            if total <= self.max_size_bytes:
+                break
+
+            logger.info(f"Evicting feature cache entry {key}")
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= sizes[key]
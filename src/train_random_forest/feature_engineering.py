@@ -1,11 +1,129 @@
-import pandas as pd
+import functools
+
 import numpy as np
+import scipy.sparse
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+def parse_days(dates):
+    """
+    Parse a 2d array of ISO dates (YYYY-MM-DD) into int64 day numbers (days since 1970-01-01).
+    The parsing is done by NumPy in a single vectorized call, without going through pd.to_datetime
+    """
+    return np.asarray(dates, dtype=str).astype("datetime64[D]").astype(np.int64)
 
 
-def delta_date_feature(dates):
+def to_float32(X):
     """
-    Given a 2d array containing dates (in any format recognized by pd.to_datetime), it returns the delta in days
-    between each date and the most recent date in its column
+    Cast an array or a sparse matrix to float32
+    """
+    return X.astype(np.float32)
+
+
+class DeltaDateTransformer(BaseEstimator, TransformerMixin):
+    """
+    Given a 2d array containing ISO dates, it returns the delta in days between each date and the
+    most recent date seen in its column at fit time.
+
+    Anchoring the delta to the training data (instead of to the batch being transformed) makes the
+    feature identical between training and inference, including for single-row predictions
+    """
+
+    def fit(self, X, y=None):
+        self.reference_day_ = parse_days(X).max(axis=0)
+        return self
+
+    def transform(self, X):
+        return self.reference_day_ - parse_days(X)
+
+    def compile_transform(self):
+        # Used by model_utils.compiled_features: transform is already a plain array -> array function
+        reference_day = self.reference_day_
+        return lambda X: reference_day - parse_days(X)
+
+
+class CachedAnalyzer:
+    """
+    Word analyzer (lowercasing, tokenization and stop words removal, like the default analyzer of
+    the scikit-learn vectorizers) with a bounded LRU cache of the tokens of each document, for
+    columns where the same strings repeat. Use it as the analyzer of a vectorizer.
+
+    The cache is not pickled
+
+    :param stop_words: stop words, as for CountVectorizer
+    :param cache_size: maximum number of documents in the cache
     """
-    date_sanitized = pd.DataFrame(dates).apply(pd.to_datetime)
-    return date_sanitized.apply(lambda d: (d.max() -d).dt.days, axis=0).to_numpy()
+
+    def __init__(self, stop_words="english", cache_size=100000):
+        self.stop_words = stop_words
+        self.cache_size = cache_size
+        self._analyze = None
+
+    def __call__(self, document):
+        if self._analyze is None:
+            analyze = CountVectorizer(stop_words=self.stop_words).build_analyzer()
+            # Tuples, so cached tokens cannot be modified by the callers
+            self._analyze = functools.lru_cache(maxsize=self.cache_size)(lambda d: tuple(analyze(d)))
+
+        return self._analyze(document)
+
+    def __getstate__(self):
+        return {**self.__dict__, "_analyze": None}
+
+
+class HashingTfidfVectorizer(BaseEstimator, TransformerMixin):
+    """
+    TF-IDF with the hashing trick: the tokens are hashed into n_features columns (no vocabulary is
+    built or stored), and only the idf of each column is fitted. The documents are hashed in
+    chunks, in parallel.
+
+    The output is the same as TfidfVectorizer with smooth_idf and l2 normalization, except that
+    tokens hashed to the same column are counted together
+
+    :param n_features: number of columns of the output
+    :param analyzer: the analyzer (see CachedAnalyzer)
+    :param chunk_size: number of documents hashed in each chunk
+    :param n_jobs: number of chunks hashed in parallel
+    """
+
+    def __init__(self, n_features=1024, analyzer=None, chunk_size=10000, n_jobs=1):
+        self.n_features = n_features
+        self.analyzer = analyzer
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def _counts(self, documents):
+        hashing = HashingVectorizer(
+            n_features=self.n_features,
+            analyzer=self.analyzer if self.analyzer is not None else "word",
+            alternate_sign=False,
+            norm=None,
+        )
+
+        documents = np.asarray(documents, dtype=object).ravel()
+        chunks = [documents[i:i + self.chunk_size] for i in range(0, len(documents), self.chunk_size)]
+        if len(chunks) == 1:
+            return hashing.transform(chunks[0])
+
+        # joblib's threads: the analyzer, and its cache, are shared between the chunks
+        counts = Parallel(n_jobs=self.n_jobs, prefer="threads")(delayed(hashing.transform)(c) for c in chunks)
+        return scipy.sparse.vstack(counts, format="csr")
+
+    def fit(self, X, y=None):
+        counts = self._counts(X)
+        n_documents = counts.shape[0]
+        document_frequency = np.bincount(counts.indices, minlength=self.n_features)
+
+        self.idf_ = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+        return self
+
+    def transform(self, X):
+        tfidf = self._counts(X).multiply(self.idf_).tocsr()
+        return normalize(tfidf, norm="l2", copy=False)
+
+    def compile_transform(self):
+        # Used by model_utils.compiled_features: hashing needs no lookup table, only the fitted idf
+        return lambda X: self.transform(X).toarray()
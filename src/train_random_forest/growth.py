@@ -0,0 +1,74 @@
+"""
+Incremental growth of a random forest with warm start, adding trees until they stop improving the
+validation error
+"""
+import logging
+
+from sklearn.metrics import mean_absolute_error
+
+
+logger = logging.getLogger()
+
+
+def _evaluate(forest, y_train, X_val, y_val):
+    result = {
+        "n_estimators": len(forest.estimators_),
+        "val_mae": mean_absolute_error(y_val, forest.predict(X_val)),
+    }
+
+    if forest.oob_score:
+        result["oob_mae"] = mean_absolute_error(y_train, forest.oob_prediction_)
+
+    return result
+
+
+def grow_forest(forest, X_train, y_train, X_val, y_val, batch_size, max_estimators, tol):
+    """
+    Add trees to the forest, batch_size at a time, until the relative improvement of the validation
+    MAE given by a batch is below tol or the forest has max_estimators trees.
+
+    If the forest is already fitted (for example, loaded from a previous model export), its trees are
+    kept and the new ones are added to them. This is only meaningful if it was fitted on the same
+    X_train and y_train (same data, split and preprocessing), otherwise its OOB estimates are wrong
+
+    :param forest: a RandomForestRegressor, fitted or not
+    :param X_train: preprocessed training features
+    :param y_train: training target
+    :param X_val: preprocessed validation features
+    :param y_val: validation target
+    :param batch_size: number of trees added at each step
+    :param max_estimators: maximum number of trees of the forest
+    :param tol: minimum relative improvement of the validation MAE to continue adding trees
+    :return: the history of the growth, a list of dictionaries with n_estimators, val_mae and
+             oob_mae (if the forest has oob_score=True)
+    """
+    history = []
+    fitted = hasattr(forest, "estimators_")
+
+    if fitted:
+        history.append(_evaluate(forest, y_train, X_val, y_val))
+        logger.info(f"Starting from {history[-1]}")
+        n_estimators = len(forest.estimators_)
+    else:
+        n_estimators = 0
+
+    forest.set_params(warm_start=True)
+
+    while n_estimators < max_estimators:
+        n_estimators = min(n_estimators + batch_size, max_estimators)
+        forest.set_params(n_estimators=n_estimators)
+        forest.fit(X_train, y_train)
+
+        history.append(_evaluate(forest, y_train, X_val, y_val))
+        logger.info(f"Grown to {history[-1]}")
+
+        if len(history) > 1:
+            previous, current = history[-2]["val_mae"], history[-1]["val_mae"]
+            if (previous - current) / previous < tol:
+                logger.info(f"Stopping: the last {batch_size} trees improved the MAE by less than {tol:.2%}")
+                break
+
+    # Further calls to fit must not add trees to this model
+    forest.set_params(warm_start=False)
+
+    return history
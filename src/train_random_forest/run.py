@@ -6,6 +6,7 @@ import argparse
 import logging
 import os
 import shutil
+import time
 import matplotlib.pyplot as plt
 
 import mlflow
@@ -13,6 +14,7 @@ import json
 
 import pandas as pd
 import numpy as np
+import scipy.sparse
 from sklearn.compose import ColumnTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.impute import SimpleImputer
@@ -20,21 +22,32 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import OrdinalEncoder, OneHotEncoder, FunctionTransformer
 
 import wandb
-from sklearn.ensemble import RandomForestRegressor
+from wandb_utils.artifact_io import use_table
+from wandb_utils.schema import LISTING_SCHEMA
+from wandb_utils.split_index import use_split
 from sklearn.metrics import mean_absolute_error
 from sklearn.pipeline import Pipeline
 
-def delta_date_feature(dates):
-    """
-    Given a 2d array containing dates (in any format recognized by pd.to_datetime),
-    it returns the delta in days between each date and the most recent date in its column
-    """
-    date_sanitized = pd.DataFrame(dates).apply(pd.to_datetime)
-    return date_sanitized.apply(lambda d: (d.max() - d).dt.days, axis=0).to_numpy()
+import cloudpickle
+import feature_engineering
+from feature_engineering import CachedAnalyzer, DeltaDateTransformer, HashingTfidfVectorizer, to_float32
+from calibration import benchmark, fit_fast
+from estimators import ESTIMATORS, accepts_sparse, build_estimator, native_categorical
+from feature_cache import FeatureCache
+from feature_layout import LAYOUTS, choose_layout, describe, to_layout
+from growth import grow_forest
+from model_utils.compiled_features import compile_preprocessor
+from model_utils.flat_forest import (
+    COMPILED_PREPROCESSOR_FILENAME, FLAT_FOREST_DIR, PREPROCESSOR_FILENAME, FlatForest
+)
+from sweep import expand_search_space, run_halving, run_sweep
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)-15s %(message)s")
 logger = logging.getLogger()
 
+# Number of validation rows stored with the cached features to check the compiled preprocessing
+CHECK_SAMPLE_ROWS = 1000
+
 def go(args):
     run = wandb.init(job_type="train_random_forest")
     run.config.update(args)
@@ -44,37 +57,234 @@ def go(args):
         rf_config = json.load(fp)
     run.config.update(rf_config)
 
+    # Get the configuration of the TF-IDF of the name
+    tfidf_config = {}
+    if args.tfidf_config != "none":
+        with open(args.tfidf_config) as fp:
+            tfidf_config = json.load(fp)
+        run.config.update({"tfidf": tfidf_config})
+
     # Fix the random seed for the Random Forest, so we get reproducible results
     rf_config['random_state'] = args.random_seed
 
-    ######################################
-    # Use run.use_artifact(...).file() to get the train and validation artifact (args.trainval_artifact)
-    # and save the returned path in trainval_local_path
-    trainval_local_path = run.use_artifact(args.trainval_artifact).file()
-    ######################################
-
-    X = pd.read_csv(trainval_local_path)
-    y = X.pop("price")  # this removes the column "price" from X and puts it into y
-
-    logger.info(f"Minimum price: {y.min()}, Maximum price: {y.max()}")
-
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=args.val_size, stratify=X[args.stratify_by], random_state=args.random_seed
-    )
-
     logger.info("Preparing sklearn pipeline")
 
-    sk_pipe, processed_features = get_inference_pipeline(rf_config, args.max_tfidf_features)
+    sk_pipe, processed_features = get_inference_pipeline(rf_config, args.max_tfidf_features, args.estimator, tfidf_config)
+
+    # The digest identifies the content of the trainval artifact, for the feature cache
+    trainval_digest = run.use_artifact(args.trainval_artifact).digest
+    if args.split_artifact != "none":
+        # The trainval artifact is the base table of the split, the rows are selected by the split
+        split = use_split(run, args.split_artifact, base_artifact=args.trainval_artifact)
+        trainval_digest += run.use_artifact(args.split_artifact).digest
+    feature_cache = (
+        FeatureCache(args.feature_cache_dir, args.feature_cache_max_size_mb * 1024 ** 2)
+        if args.feature_cache_dir != "none" else None
+    )
 
-     # Then fit it to the X_train, y_train data
-    logger.info("Fitting")
-    sk_pipe.fit(X_train, y_train)
+    splits = []
+
+    def train_val_split():
+        # Read and split the data only once, and only if some features are not in the cache
+        if not splits:
+            # Only read the columns used by the pipeline, the target and the stratification column
+            columns = processed_features + ["price"]
+            if args.stratify_by != "none" and args.stratify_by not in columns:
+                columns.append(args.stratify_by)
+
+            X = use_table(run, args.trainval_artifact, columns=columns, schema=LISTING_SCHEMA)
+            y = X.pop("price")  # this removes the column "price" from X and puts it into y
+
+            logger.info(f"Minimum price: {y.min()}, Maximum price: {y.max()}")
+
+            if args.split_artifact != "none" and split.folds is not None:
+                # Validate on one of the cross-validation folds of the trainval rows
+                train_rows, val_rows = split.fold(args.fold, args.repeat)
+                logger.info(
+                    f"Validating on fold {args.fold} of {split.n_splits} (repetition {args.repeat} of {split.n_repeats})"
+                )
+                splits.extend([X.iloc[train_rows], X.iloc[val_rows], y.iloc[train_rows], y.iloc[val_rows]])
+            else:
+                if args.split_artifact != "none":
+                    X, y = split.take(X, "trainval"), split.take(y, "trainval")
+                splits.extend(train_test_split(
+                    X, y, test_size=args.val_size, stratify=X[args.stratify_by], random_state=args.random_seed
+                ))
+
+        return splits
+
+    features = {}
+    # A few raw validation rows, to check the compiled preprocessing when the data was not read
+    check_sample = []
+    max_dense_bytes = args.max_dense_mb * 1024 ** 2
+    # Estimators that need dense features get them even above max_dense_mb
+    feature_layout = args.feature_layout if accepts_sparse(args.estimator) else "dense"
+
+    def fit_transform_features(max_tfidf_features):
+        """
+        Return the fitted preprocessor and the preprocessed train and validation sets
+        """
+        if max_tfidf_features in features:
+            return features[max_tfidf_features]
+
+        key = FeatureCache.key(
+            trainval_digest,
+            val_size=args.val_size,
+            random_seed=args.random_seed,
+            stratify_by=args.stratify_by,
+            max_tfidf_features=max_tfidf_features,
+            estimator=args.estimator,
+            tfidf=tfidf_config,
+            schema=LISTING_SCHEMA,
+            fold=args.fold,
+            repeat=args.repeat,
+        )
+        cached = feature_cache.load(key) if feature_cache is not None else None
+
+        if cached is None:
+            X_train, X_val, y_train, y_val = train_val_split()
+
+            preprocessor = get_inference_pipeline(rf_config, max_tfidf_features, args.estimator, tfidf_config)[0]["preprocessor"]
+            X_train_t = preprocessor.fit_transform(X_train, y_train)
+            cached = (
+                preprocessor,
+                X_train_t,
+                y_train.to_numpy(),
+                preprocessor.transform(X_val),
+                y_val.to_numpy(),
+                X_val.head(CHECK_SAMPLE_ROWS),
+            )
+
+            if feature_cache is not None:
+                feature_cache.save(key, *cached)
+
+        # Fit on float32 CSC or C-contiguous arrays, so the model makes no copy of the features
+        preprocessor, X_train_t, y_train, X_val_t, y_val, sample = cached
+        if not check_sample:
+            check_sample.append(sample)
+        layout = choose_layout(X_train_t, feature_layout, max_dense_bytes)
+        features[max_tfidf_features] = (
+            preprocessor,
+            to_layout(X_train_t, layout, fit=True),
+            y_train,
+            to_layout(X_val_t, layout),
+            y_val,
+        )
+        return features[max_tfidf_features]
+
+    if args.sweep_config != "none":
+        # Evaluate all the configurations of the sweep, then train the best one
+        with open(args.sweep_config) as fp:
+            sweep_config = json.load(fp)
+
+        trials = expand_search_space(sweep_config["parameters"], sweep_config["n_trials"], args.random_seed)
+        for trial in trials:
+            trial.setdefault("max_tfidf_features", args.max_tfidf_features)
+        logger.info(f"Running a sweep with {len(trials)} trials")
+
+        if sweep_config.get("strategy", "exhaustive") == "halving":
+            results, rungs = run_halving(
+                trials,
+                rf_config,
+                fit_transform_features,
+                sweep_config["n_cpus"],
+                eta=sweep_config["halving"]["eta"],
+                min_fraction=sweep_config["halving"]["min_fraction"],
+                seed=args.random_seed,
+            )
+            run.log({"sweep_rungs": wandb.Table(dataframe=pd.DataFrame(rungs))})
+        else:
+            results = run_sweep(trials, rf_config, fit_transform_features, sweep_config["n_cpus"])
+        run.log({"sweep": wandb.Table(dataframe=pd.DataFrame(results))})
+
+        best = min(results, key=lambda r: r["mae"])
+        logger.info(f"Best trial: {best}")
+        args.max_tfidf_features = best["max_tfidf_features"]
+        rf_config.update({k: v for k, v in best.items() if k not in ("max_tfidf_features", "mae", "r2")})
+        run.config.update({"max_tfidf_features": args.max_tfidf_features, **rf_config}, allow_val_change=True)
+
+        sk_pipe, processed_features = get_inference_pipeline(rf_config, args.max_tfidf_features, args.estimator, tfidf_config)
+
+    if args.warm_start_model != "none":
+        # Continue the model of a previous run: reuse its preprocessing and add trees to its forest
+        logger.info(f"Loading {args.warm_start_model}")
+        sk_pipe = mlflow.sklearn.load_model(run.use_artifact(args.warm_start_model).download())
+
+        X_train, X_val, y_train, y_val = train_val_split()
+        X_train_t = sk_pipe["preprocessor"].transform(X_train)
+        X_val_t = sk_pipe["preprocessor"].transform(X_val)
+        matrix_layout = choose_layout(X_train_t, feature_layout, max_dense_bytes)
+        X_train_t = to_layout(X_train_t, matrix_layout, fit=True)
+        X_val_t = to_layout(X_val_t, matrix_layout)
+        y_train, y_val = y_train.to_numpy(), y_val.to_numpy()
+    else:
+        # The preprocessing is already fitted (or loaded from the cache): only fit the random forest
+        preprocessor, X_train_t, y_train, X_val_t, y_val = fit_transform_features(args.max_tfidf_features)
+        sk_pipe.steps[0] = ("preprocessor", preprocessor)
+
+    layout = describe(X_train_t)
+    logger.info(f"Training features: {layout}")
+    run.summary.update({f"features_{k}": v for k, v in layout.items()})
+
+    fit_start = time.perf_counter()
+
+    if args.growth_config != "none":
+        # Add trees until they stop improving the validation MAE, so n_estimators is chosen by the data
+        with open(args.growth_config) as fp:
+            growth_config = json.load(fp)
+
+        logger.info("Growing")
+        history = grow_forest(
+            sk_pipe["random_forest"],
+            X_train_t,
+            y_train,
+            X_val_t,
+            y_val,
+            growth_config["batch_size"],
+            growth_config["max_estimators"],
+            growth_config["tol"],
+        )
+        for step in history:
+            run.log(step)
+
+        rf_config["n_estimators"] = sk_pipe["random_forest"].n_estimators
+        run.summary["n_estimators"] = rf_config["n_estimators"]
+    elif args.fast_config != "none":
+        # Grow the trees with a fast criterion, then recalibrate the leaves to medians for the MAE
+        with open(args.fast_config) as fp:
+            fast_config = json.load(fp)
+
+        logger.info(f"Fitting with criterion {fast_config['criterion']} and median leaves")
+        start = time.perf_counter()
+        fit_fast(
+            sk_pipe["random_forest"],
+            X_train_t,
+            y_train,
+            criterion=fast_config["criterion"],
+            log_target=fast_config["log_target"],
+        )
+        fit_time = time.perf_counter() - start
+        rf_config["criterion"] = fast_config["criterion"]
+
+        if fast_config["benchmark"]:
+            logger.info("Benchmarking against criterion absolute_error")
+            report = benchmark(sk_pipe["random_forest"], fit_time, X_train_t, y_train, X_val_t, y_val)
+            run.log({"fast_benchmark": wandb.Table(dataframe=pd.DataFrame(report))})
+            for row in report:
+                run.summary[f"benchmark_{row['strategy']}_fit_time"] = row["fit_time"]
+                run.summary[f"benchmark_{row['strategy']}_mae"] = row["mae"]
+    else:
+        # Then fit the random forest to the preprocessed X_train, y_train data
+        logger.info("Fitting")
+        sk_pipe[-1].fit(X_train_t, y_train)
+
+    run.summary["fit_time"] = time.perf_counter() - fit_start
 
     # Compute r2 and MAE
     logger.info("Scoring")
-    r_squared = sk_pipe.score(X_val, y_val)
+    r_squared = sk_pipe[-1].score(X_val_t, y_val)
 
-    y_pred = sk_pipe.predict(X_val)
+    y_pred = sk_pipe[-1].predict(X_val_t)
     mae = mean_absolute_error(y_val, y_pred)
 
     logger.info(f"Score: {r_squared}")
@@ -86,35 +296,83 @@ def go(args):
     # Save model package in the MLFlow sklearn format
     if os.path.exists("random_forest_dir"):
         shutil.rmtree("random_forest_dir")
+    # The custom transformers live in modules of this step, which are not available where the
+    # model is loaded. Embed their code in the pickle instead of a reference to the module
+    cloudpickle.register_pickle_by_value(feature_engineering)
     mlflow.sklearn.save_model(sk_pipe, "random_forest_dir")
 
+    if args.export_flat_forest == "true":
+        # Also export the forest as flat arrays, that load instantly (memory-mapped), together with
+        # the preprocessing alone
+        flat_forest_dir = os.path.join("random_forest_dir", FLAT_FOREST_DIR)
+        FlatForest.from_forest(sk_pipe["random_forest"]).save(flat_forest_dir)
+        with open(os.path.join(flat_forest_dir, PREPROCESSOR_FILENAME), "wb") as fp:
+            cloudpickle.dump(sk_pipe["preprocessor"], fp)
+
+        # And the preprocessing compiled to a function of column arrays, for fast single-row scoring,
+        # if it produces exactly the same features
+        # Check on the validation set if it was read, otherwise on the sample stored with the
+        # cached features, rather than reading the data only for the check
+        X_check = train_val_split()[1] if splits else check_sample[0]
+        compiled = compile_and_check(sk_pipe["preprocessor"], X_check)
+        if compiled is not None:
+            with open(os.path.join(flat_forest_dir, COMPILED_PREPROCESSOR_FILENAME), "wb") as fp:
+                cloudpickle.dump(compiled, fp)
+
     ######################################
     # Upload the model we just exported to W&B
     artifact = wandb.Artifact(args.output_artifact, type="model_export", description="Random Forest model export")
     artifact.add_dir("random_forest_dir")
     # Log parameters (including your rf_config)
-    wandb.config.update(args)  # Log all arguments passed via command line
-    wandb.config.update(rf_config)  # Log your RandomForest configuration
+    wandb.config.update(args, allow_val_change=True)  # Log all arguments passed via command line
+    wandb.config.update(rf_config, allow_val_change=True)  # Log your RandomForest configuration
     run.log_artifact(artifact)
     ######################################
 
-    # Plot feature importance
-    fig_feat_imp = plot_feature_importance(sk_pipe, processed_features)
-
     run.summary['r2'] = r_squared
     run.summary['mae'] = mae
 
-    # Upload feature importance visualization to W&B
-    run.log({
-        "feature_importance": wandb.Image(fig_feat_imp),
-    })
+    # Plot feature importance (not all the estimators provide it)
+    if hasattr(sk_pipe[-1], "feature_importances_"):
+        fig_feat_imp = plot_feature_importance(sk_pipe, processed_features)
+
+        # Upload feature importance visualization to W&B
+        run.log({
+            "feature_importance": wandb.Image(fig_feat_imp),
+        })
+
+def compile_and_check(preprocessor, X):
+    """
+    Compile the fitted preprocessor (see model_utils.compiled_features) and check that it gives
+    exactly the same features on X
+
+    :return: the CompiledPreprocessor, or None if the preprocessor cannot be compiled or the
+             features differ
+    """
+    try:
+        compiled = compile_preprocessor(preprocessor)
+    except NotImplementedError as e:
+        logger.warning(f"Cannot compile the preprocessing: {e}")
+        return None
+
+    expected = preprocessor.transform(X)
+    if scipy.sparse.issparse(expected):
+        expected = expected.toarray()
+
+    features = compiled.transform({c: X[c].to_numpy() for c in compiled.columns})
+    if not np.array_equal(features, expected, equal_nan=True):
+        logger.warning("The compiled preprocessing does not reproduce the features, not exporting it")
+        return None
+
+    return compiled
+
 
 def plot_feature_importance(pipe, feat_names):
     # We collect the feature importance for all non-nlp features first
-    feat_imp = pipe["random_forest"].feature_importances_[: len(feat_names)-1]
+    feat_imp = pipe[-1].feature_importances_[: len(feat_names)-1]
     # For the NLP feature we sum across all the TF-IDF dimensions into a global
     # NLP importance
-    nlp_importance = sum(pipe["random_forest"].feature_importances_[len(feat_names) - 1:])
+    nlp_importance = sum(pipe[-1].feature_importances_[len(feat_names) - 1:])
     feat_imp = np.append(feat_imp, nlp_importance)
     fig_feat_imp, sub_feat_imp = plt.subplots(figsize=(10, 10))
     sub_feat_imp.bar(range(feat_imp.shape[0]), feat_imp, color="r", align="center")
@@ -123,22 +381,52 @@ def plot_feature_importance(pipe, feat_names):
     fig_feat_imp.tight_layout()
     return fig_feat_imp
 
-def get_inference_pipeline(rf_config, max_tfidf_features):
-    random_forest = RandomForestRegressor(**rf_config)
+def get_tfidf_vectorizer(max_tfidf_features, tfidf_config):
+    """
+    Build the TF-IDF of the name. With mode "vocabulary" (the default), a TfidfVectorizer keeping the
+    max_tfidf_features most frequent words. With mode "hashing", a HashingTfidfVectorizer with
+    max_tfidf_features columns. With cache_size > 0, the tokens of the names are cached
+    """
+    cache_size = tfidf_config.get("cache_size", 0)
+    analyzer = CachedAnalyzer(stop_words='english', cache_size=cache_size) if cache_size > 0 else None
+
+    if tfidf_config.get("mode", "vocabulary") == "hashing":
+        return HashingTfidfVectorizer(
+            n_features=max_tfidf_features,
+            analyzer=analyzer if analyzer is not None else CachedAnalyzer(stop_words='english', cache_size=0),
+            n_jobs=tfidf_config.get("n_jobs", 1),
+        )
+
+    if analyzer is not None:
+        return TfidfVectorizer(binary=False, max_features=max_tfidf_features, analyzer=analyzer)
+
+    return TfidfVectorizer(binary=False, max_features=max_tfidf_features, stop_words='english')
+
+
+def get_inference_pipeline(rf_config, max_tfidf_features, estimator="random_forest", tfidf_config=None):
     ordinal_categorical = ["room_type"]
     non_ordinal_categorical = ["neighbourhood_group"]
 
-    ordinal_categorical_preproc = OrdinalEncoder()
-
-    ######################################
-    # Build a pipeline with two steps:
-    # 1 - A SimpleImputer(strategy="most_frequent") to impute missing values
-    # 2 - A OneHotEncoder() step to encode the variable
-    non_ordinal_categorical_preproc = Pipeline([
-        ('imputer', SimpleImputer(strategy="most_frequent")),
-        ('encoder', OneHotEncoder())
-    ])
-    ######################################
+    # All the transformers output float32, the type used by the trees, so the preprocessed features
+    # are float32 without a float64 copy
+    ordinal_categorical_preproc = OrdinalEncoder(dtype=np.float32)
+
+    if native_categorical(estimator):
+        # The estimator splits on categories directly: ordinal-encode the non-ordinal categorical
+        # columns too, leaving missing and unknown values as NaN
+        non_ordinal_categorical_preproc = OrdinalEncoder(
+            handle_unknown="use_encoded_value", unknown_value=np.nan, dtype=np.float32
+        )
+    else:
+        ######################################
+        # Build a pipeline with two steps:
+        # 1 - A SimpleImputer(strategy="most_frequent") to impute missing values
+        # 2 - A OneHotEncoder() step to encode the variable
+        non_ordinal_categorical_preproc = Pipeline([
+            ('imputer', SimpleImputer(strategy="most_frequent")),
+            ('encoder', OneHotEncoder(dtype=np.float32))
+        ])
+        ######################################
 
     zero_imputed = [
         "minimum_nights",
@@ -149,18 +437,25 @@ def get_inference_pipeline(rf_config, max_tfidf_features):
         "longitude",
         "latitude"
     ]
-    zero_imputer = SimpleImputer(strategy="constant", fill_value=0)
+    # The imputer gives float64 for a mix of float32 and int32 columns
+    zero_imputer = Pipeline([
+        ('imputer', SimpleImputer(strategy="constant", fill_value=0)),
+        ('float32', FunctionTransformer(to_float32))
+    ])
 
     date_imputer = Pipeline([
         ('imputer', SimpleImputer(strategy='constant', fill_value='2010-01-01')),
-        ('transform', FunctionTransformer(delta_date_feature, check_inverse=False, validate=False))
+        ('transform', DeltaDateTransformer()),
+        ('float32', FunctionTransformer(to_float32))
     ])
 
     reshape_to_1d = FunctionTransformer(np.reshape, kw_args={"newshape": -1})
     name_tfidf = Pipeline([
         ('imputer', SimpleImputer(strategy="constant", fill_value="")),
         ('reshape', reshape_to_1d),
-        ('tfidf', TfidfVectorizer(binary=False, max_features=max_tfidf_features, stop_words='english')),
+        ('tfidf', get_tfidf_vectorizer(max_tfidf_features, tfidf_config or {})),
+        # Computed in float64 then rounded, like the float64 features were when cast by the trees
+        ('float32', FunctionTransformer(to_float32)),
     ])
 
     preprocessor = ColumnTransformer(
@@ -171,16 +466,19 @@ def get_inference_pipeline(rf_config, max_tfidf_features):
             ("transform_date", date_imputer, ["last_review"]),
             ("transform_name", name_tfidf, ["name"])
         ],
-        remainder="drop"
+        remainder="drop",
+        # Estimators with native categorical support need dense input
+        sparse_threshold=0 if native_categorical(estimator) else 0.3
     )
 
     processed_features = ordinal_categorical + non_ordinal_categorical + zero_imputed + ["last_review", "name"]
 
-    random_forest = RandomForestRegressor(**rf_config)
+    # The categorical columns are the first of the preprocessed features
+    categorical_features = list(range(len(ordinal_categorical + non_ordinal_categorical)))
 
     sk_pipe = Pipeline([
         ('preprocessor', preprocessor),
-        ('random_forest', random_forest)
+        (estimator, build_estimator(estimator, rf_config, categorical_features))
     ])
 
     return sk_pipe, processed_features
@@ -216,10 +514,45 @@ if __name__ == "__main__":
         required=False,
     )
 
+    parser.add_argument(
+        "--split_artifact",
+        type=str,
+        help="Split of the trainval artifact made by train_val_test_split with split_mode index, "
+        "or none if the trainval artifact only contains the trainval rows",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--fold",
+        type=int,
+        help="Cross-validation fold used for validation, if the split has folds (instead of "
+        "a random split of size val_size)",
+        default=0,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        help="Repetition of the cross-validation the fold is taken from, if the split has folds",
+        default=0,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--estimator",
+        type=str,
+        choices=list(ESTIMATORS),
+        help="Estimator trained on the preprocessed features",
+        default="random_forest",
+        required=False,
+    )
+
     parser.add_argument(
         "--rf_config",
-        help="Random forest configuration. A JSON dict that will be passed to the "
-        "scikit-learn constructor for RandomForestRegressor.",
+        help="Estimator configuration. A JSON dict that will be passed to the "
+        "scikit-learn constructor of the estimator (RandomForestRegressor for random_forest).",
         default="{}",
     )
 
@@ -230,6 +563,100 @@ if __name__ == "__main__":
         type=int
     )
 
+    parser.add_argument(
+        "--tfidf_config",
+        type=str,
+        help="Path to a JSON file with the configuration of the TF-IDF of the name (mode, cache_size "
+        "and n_jobs), or 'none' for the defaults",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--feature_layout",
+        type=str,
+        choices=LAYOUTS,
+        help="Layout of the feature matrices used for training: dense, sparse, or auto (dense if "
+        "it fits in --max_dense_mb). See feature_layout.py",
+        default="auto",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--max_dense_mb",
+        type=int,
+        help="Maximum size (in MB) of the dense training features with --feature_layout auto",
+        default=1024,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--feature_cache_dir",
+        type=str,
+        help="Directory where the fitted preprocessing and the preprocessed train and validation sets "
+        "are cached, or 'none' to disable the cache",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--feature_cache_max_size_mb",
+        type=int,
+        help="Maximum size (in MB) of the feature cache, the least recently used entries are removed "
+        "above it",
+        default=2048,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--sweep_config",
+        type=str,
+        help="Path to a JSON file with the configuration of a hyperparameter sweep (parameters, "
+        "n_trials, n_cpus, strategy and halving). If provided, the trials are evaluated and the "
+        "best one is exported",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--growth_config",
+        type=str,
+        help="Path to a JSON file with the configuration of the incremental growth of the forest "
+        "(batch_size, max_estimators and tol). If provided, trees are added in batches until the "
+        "relative improvement of the validation MAE is below tol",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--fast_config",
+        type=str,
+        help="Path to a JSON file with the configuration of the fast training (criterion, log_target "
+        "and benchmark). If provided, the trees are grown with the fast criterion and their leaves "
+        "are recalibrated to the median of the target",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--warm_start_model",
+        type=str,
+        help="Model export of a previous run, trained on the same data, to which trees are added "
+        "(requires --growth_config), or 'none'",
+        default="none",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--export_flat_forest",
+        type=str,
+        choices=["true", "false"],
+        help="Whether to also export the random forest as flat arrays (in the flat_forest subdirectory "
+        "of the model export)",
+        default="false",
+        required=False,
+    )
+
     parser.add_argument(
         "--output_artifact",
         type=str,
@@ -239,4 +666,24 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
+    if args.warm_start_model != "none":
+        if args.growth_config == "none":
+            parser.error("--warm_start_model requires --growth_config")
+        if args.sweep_config != "none":
+            parser.error("--warm_start_model cannot be used with --sweep_config")
+
+    if args.fast_config != "none" and args.growth_config != "none":
+        parser.error("--fast_config cannot be used with --growth_config")
+
+    # The sweep, the growth and the fast training are specific to the random forest
+    if args.estimator != "random_forest":
+        for option in ["sweep_config", "growth_config", "fast_config", "warm_start_model"]:
+            if getattr(args, option) != "none":
+                parser.error(f"--{option} requires --estimator random_forest")
+        if args.export_flat_forest == "true":
+            parser.error("--export_flat_forest requires --estimator random_forest")
+
+    if args.feature_layout == "sparse" and not accepts_sparse(args.estimator):
+        parser.error(f"--estimator {args.estimator} does not accept --feature_layout sparse")
+
     go(args)
@@ -0,0 +1,205 @@
+"""
+Hyperparameter sweep over the Random Forest configuration and max_tfidf_features, run in a single
+training step
+"""
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import wandb
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+
+
+logger = logging.getLogger()
+
+
+def _sample(spec, rng):
+    distribution = spec["distribution"]
+
+    if distribution == "uniform":
+        return float(rng.uniform(spec["min"], spec["max"]))
+    elif distribution == "int_uniform":
+        return int(rng.integers(spec["min"], spec["max"] + 1))
+    elif distribution == "log_uniform":
+        return float(np.exp(rng.uniform(np.log(spec["min"]), np.log(spec["max"]))))
+    else:
+        raise ValueError(f"Unknown distribution {distribution}")
+
+
+def expand_search_space(parameters, n_trials, seed):
+    """
+    Build the list of trials of a sweep. Each parameter is either a list of values or a
+    distribution: a dictionary with "distribution" (uniform, int_uniform or log_uniform), "min" and
+    "max". If all parameters are lists, the trials are the full grid. Otherwise n_trials trials are
+    sampled at random (the lists are sampled uniformly)
+
+    :param parameters: dictionary parameter -> list of values or distribution
+    :param n_trials: number of trials for random search
+    :param seed: seed for random search
+    :return: list of dictionaries parameter -> value
+    """
+    names = list(parameters)
+
+    if all(isinstance(parameters[n], (list, tuple)) for n in names):
+        return [dict(zip(names, values)) for values in itertools.product(*(parameters[n] for n in names))]
+
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(n_trials):
+        trial = {}
+        for n in names:
+            spec = parameters[n]
+            if isinstance(spec, (list, tuple)):
+                trial[n] = spec[rng.integers(len(spec))]
+            else:
+                trial[n] = _sample(spec, rng)
+        trials.append(trial)
+
+    return trials
+
+
+# Transformed training and validation data, set once in each worker process
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _fit_trial(trial, rf_config, rows=None, final=True):
+    X_train, y_train, X_val, y_val = _worker_data
+    if rows is not None:
+        X_train, y_train = X_train[rows], y_train[rows]
+
+    random_forest = RandomForestRegressor(**rf_config)
+    random_forest.fit(X_train, y_train)
+
+    if not final:
+        # Intermediate rung of successive halving: the OOB score is the (cheap) ranking signal
+        return {**trial, "n_rows": len(y_train), "oob_r2": random_forest.oob_score_}
+
+    y_pred = random_forest.predict(X_val)
+    mae = mean_absolute_error(y_val, y_pred)
+    r_squared = random_forest.score(X_val, y_val)
+
+    # Each trial is a separate run in the experiment group (WANDB_RUN_GROUP)
+    run = wandb.init(job_type="train_random_forest_trial", config=trial, reinit=True)
+    run.summary["mae"] = mae
+    run.summary["r2"] = r_squared
+    run.finish()
+
+    return {**trial, "mae": mae, "r2": r_squared}
+
+
+def _run_trials(trials, rf_config, fit_transform_features, n_cpus, **kwargs):
+    """
+    Fit the trials in process pools, one per value of max_tfidf_features, and return their results
+    in the same order as the trials. kwargs are passed to _fit_trial
+    """
+    n_cpus = os.cpu_count() if n_cpus == -1 else n_cpus
+
+    groups = {}
+    for i, trial in enumerate(trials):
+        groups.setdefault(trial["max_tfidf_features"], []).append(i)
+
+    results = [None] * len(trials)
+
+    for max_tfidf_features, group in groups.items():
+        logger.info(f"Preparing features with max_tfidf_features={max_tfidf_features} for {len(group)} trials")
+        _, *data = fit_transform_features(max_tfidf_features)
+
+        n_workers = min(len(group), n_cpus)
+        n_jobs = max(n_cpus // n_workers, 1)
+
+        # Spawn (instead of fork) so that W&B can start fresh runs in the workers
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(data,),
+        ) as pool:
+            futures = {}
+            for i in group:
+                trial = trials[i]
+                trial_rf_config = {**rf_config, **{k: v for k, v in trial.items() if k != "max_tfidf_features"}}
+                trial_rf_config["n_jobs"] = n_jobs
+                futures[i] = pool.submit(_fit_trial, trial, trial_rf_config, **kwargs)
+
+            for i, future in futures.items():
+                results[i] = future.result()
+                logger.info(f"Trial {results[i]}")
+
+    return results
+
+
+def run_sweep(trials, rf_config, fit_transform_features, n_cpus):
+    """
+    Evaluate the trials of a sweep. The preprocessing is fitted once for each value of
+    max_tfidf_features, then the forests of all the trials sharing it are fitted in a process pool.
+    The n_cpus CPUs are split between the workers, so that the trials use n_cpus CPUs in total
+
+    :param trials: list of dictionaries parameter -> value (see expand_search_space).
+                   max_tfidf_features is passed to the preprocessing, the other parameters to
+                   RandomForestRegressor
+    :param rf_config: base configuration for RandomForestRegressor
+    :param fit_transform_features: function max_tfidf_features -> (fitted preprocessor, X_train,
+                                   y_train, X_val, y_val), with the transformed features
+    :param n_cpus: number of CPUs available to the sweep (-1 for all of them)
+    :return: the list of results (the trial parameters plus "mae" and "r2")
+    """
+    return _run_trials(trials, rf_config, fit_transform_features, n_cpus)
+
+
+def run_halving(trials, rf_config, fit_transform_features, n_cpus, eta=3, min_fraction=1 / 9, seed=42):
+    """
+    Evaluate the trials of a sweep with successive halving. All the trials are first fitted on a
+    random subset (min_fraction) of the training rows and ranked by their OOB score. The best
+    1 / eta of them are promoted to the next rung, which uses eta times more rows, until the rung
+    uses all the rows. Only the trials that reach it are fitted on the full training set and
+    evaluated on the validation set, like in run_sweep
+
+    :param trials: list of dictionaries parameter -> value (see run_sweep)
+    :param rf_config: base configuration for RandomForestRegressor
+    :param fit_transform_features: see run_sweep
+    :param n_cpus: number of CPUs available to the sweep (-1 for all of them)
+    :param eta: reduction factor: fraction of the trials promoted at each rung, and growth of the rows
+    :param min_fraction: fraction of the training rows used in the first rung
+    :param seed: seed for the selection of the rows
+    :return: the results of the trials in the last rung (see run_sweep), and the results of all the
+             intermediate rungs (the trial parameters plus "rung", "n_rows" and "oob_r2")
+    """
+    n_rows = len(fit_transform_features(trials[0]["max_tfidf_features"])[2])
+
+    # The subsets are nested: each rung adds rows to the previous one
+    order = np.random.default_rng(seed).permutation(n_rows)
+
+    # The OOB predictions need bootstrapping
+    rung_rf_config = {**rf_config, "bootstrap": True, "oob_score": True}
+
+    rungs = []
+    candidates = trials
+    fraction = min_fraction
+    rung = 0
+
+    while fraction < 1 and len(candidates) > 1:
+        rows = np.sort(order[:max(int(fraction * n_rows), 1)])
+        logger.info(f"Rung {rung}: fitting {len(candidates)} trials on {len(rows)} rows")
+
+        results = _run_trials(candidates, rung_rf_config, fit_transform_features, n_cpus, rows=rows, final=False)
+        rungs.extend({**r, "rung": rung} for r in results)
+
+        n_promoted = max(math.ceil(len(candidates) / eta), 1)
+        ranking = sorted(range(len(candidates)), key=lambda i: results[i]["oob_r2"], reverse=True)
+        candidates = [candidates[i] for i in sorted(ranking[:n_promoted])]
+
+        fraction *= eta
+        rung += 1
+
+    logger.info(f"Final rung: fitting {len(candidates)} trials on all the rows")
+    return _run_trials(candidates, rf_config, fit_transform_features, n_cpus), rungs
@@ -0,0 +1,23 @@
+import numpy as np
+import scipy.sparse
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
+
+from calibration import fit_fast
+
+
+def _data(n_rows=400):
+    rng = np.random.default_rng(0)
+    X = rng.random((n_rows, 5)).astype(np.float32)
+    y = np.exp(3 * X[:, 0]) + rng.random(n_rows)
+    return scipy.sparse.csc_matrix(X), y
+
+
+def test_oob_score_is_on_the_scale_of_the_target_with_log_target():
+    X, y = _data()
+
+    forest = fit_fast(RandomForestRegressor(n_estimators=20, oob_score=True, random_state=0), X, y, log_target=True)
+
+    # The OOB predictions of the recalibrated leaves are prices, not log(1 + price)
+    assert abs(np.median(forest.oob_prediction_) - np.median(y)) < 0.2 * np.median(y)
+    assert forest.oob_score_ == r2_score(y, forest.oob_prediction_)
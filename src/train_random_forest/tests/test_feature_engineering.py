@@ -0,0 +1,58 @@
+import pickle
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+
+from feature_engineering import CachedAnalyzer, HashingTfidfVectorizer
+
+
+NAMES = np.array([
+    "Cozy room in Brooklyn",
+    "Sunny loft near the park",
+    "Cozy loft in Manhattan",
+    "Room in a shared apartment",
+    "Sunny room, cozy and quiet",
+    "Cozy room in Brooklyn",
+], dtype=object)
+
+
+def test_cached_analyzer_hits_and_misses_give_the_same_tokens():
+    analyzer = CachedAnalyzer(cache_size=2)
+    reference = CountVectorizer(stop_words="english").build_analyzer()
+
+    # The first and last names repeat (hits), the small cache also evicts some of them (misses)
+    tokens = [analyzer(name) for name in list(NAMES) * 2]
+
+    assert tokens == [tuple(reference(name)) for name in list(NAMES) * 2]
+    assert analyzer._analyze.cache_info().hits > 0
+    assert analyzer._analyze.cache_info().misses > len(set(NAMES))
+
+
+def test_cached_analyzer_is_pickled_without_its_cache():
+    analyzer = CachedAnalyzer()
+    analyzer(NAMES[0])
+
+    restored = pickle.loads(pickle.dumps(analyzer))
+
+    assert restored._analyze is None
+    assert restored(NAMES[0]) == analyzer(NAMES[0])
+
+
+def test_hashing_tfidf_matches_tfidf_without_collisions():
+    n_features = 2 ** 20
+    analyzer = CachedAnalyzer()
+    # Chunks of 2 documents, hashed in parallel
+    vectorizer = HashingTfidfVectorizer(n_features=n_features, analyzer=analyzer, chunk_size=2, n_jobs=2)
+    reference = TfidfVectorizer(analyzer=analyzer)
+
+    features = vectorizer.fit(NAMES).transform(NAMES[::-1])
+    expected = reference.fit(NAMES).transform(NAMES[::-1])
+
+    # Column of each token of the reference vocabulary in the hashed features
+    hashing = HashingVectorizer(n_features=n_features, analyzer=lambda tokens: tokens, alternate_sign=False)
+    tokens = sorted(reference.vocabulary_, key=reference.vocabulary_.get)
+    columns = [hashing.transform([[token]]).indices[0] for token in tokens]
+    assert len(set(columns)) == len(columns)
+
+    np.testing.assert_allclose(features[:, columns].toarray(), expected.toarray())
+    assert features.nnz == expected.nnz
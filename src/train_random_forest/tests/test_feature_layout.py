@@ -0,0 +1,26 @@
+import numpy as np
+import scipy.sparse
+
+from feature_layout import choose_layout, to_layout
+
+
+def test_validation_matrix_gets_the_layout_of_the_training_matrix():
+    X_train = scipy.sparse.random(1000, 50, density=0.05, format="csr", random_state=0)
+    X_val = scipy.sparse.random(100, 50, density=0.05, format="csr", random_state=1)
+    # The training matrix is too large to be dense, the validation one is not
+    max_dense_bytes = 100 * 50 * 4
+
+    layout = choose_layout(X_train, "auto", max_dense_bytes)
+
+    assert layout == "sparse"
+    assert to_layout(X_train, layout, fit=True).format == "csc"
+    assert to_layout(X_val, layout).format == "csr"
+
+
+def test_dense_layout_is_float32_and_c_contiguous():
+    X = scipy.sparse.random(100, 20, density=0.1, format="csr", random_state=0)
+
+    dense = to_layout(X, choose_layout(X, "auto"))
+
+    assert dense.dtype == np.float32 and dense.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(dense, X.toarray().astype(np.float32))
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+# The trials are logged as W&B runs
+pytest.importorskip("wandb")
+
+from sweep import expand_search_space, run_halving, run_sweep
+
+
+@pytest.fixture
+def offline_wandb(monkeypatch):
+    # Inherited by the worker processes, so the trials do not log anything
+    monkeypatch.setenv("WANDB_MODE", "disabled")
+
+
+def _fit_transform_features(max_tfidf_features):
+    rng = np.random.default_rng(0)
+    X = rng.random((300, 4)).astype(np.float32)
+    y = 10 * X[:, 0] + rng.random(300)
+    return None, X[:200], y[:200], X[200:], y[200:]
+
+
+def test_grid_search_space_is_the_full_grid():
+    trials = expand_search_space({"max_depth": [5, 10], "max_tfidf_features": [1, 2, 3]}, n_trials=1, seed=0)
+
+    assert len(trials) == 6
+    assert {(t["max_depth"], t["max_tfidf_features"]) for t in trials} == {
+        (d, f) for d in [5, 10] for f in [1, 2, 3]
+    }
+
+
+def test_random_search_space_samples_the_distributions():
+    parameters = {
+        "max_depth": {"distribution": "int_uniform", "min": 2, "max": 4},
+        "max_features": {"distribution": "log_uniform", "min": 0.1, "max": 1.0},
+        "max_tfidf_features": [10, 20],
+    }
+
+    trials = expand_search_space(parameters, n_trials=20, seed=0)
+
+    assert trials == expand_search_space(parameters, n_trials=20, seed=0)
+    assert len(trials) == 20
+    assert all(2 <= t["max_depth"] <= 4 and isinstance(t["max_depth"], int) for t in trials)
+    assert all(0.1 <= t["max_features"] <= 1.0 for t in trials)
+    assert all(t["max_tfidf_features"] in (10, 20) for t in trials)
+
+
+def test_sweep_results_are_in_the_order_of_the_trials(offline_wandb):
+    trials = [
+        {"max_depth": 1, "max_tfidf_features": 5},
+        {"max_depth": 8, "max_tfidf_features": 5},
+    ]
+
+    results = run_sweep(trials, {"n_estimators": 5, "random_state": 0}, _fit_transform_features, n_cpus=2)
+
+    assert [r["max_depth"] for r in results] == [1, 8]
+    # The deeper trees fit the target better
+    assert results[1]["mae"] < results[0]["mae"]
+    assert results[1]["r2"] > results[0]["r2"]
+
+
+def test_halving_promotes_the_best_trials_to_more_rows(offline_wandb):
+    trials = [{"max_depth": depth, "max_tfidf_features": 5} for depth in [1, 2, 3, 12]]
+
+    results, rungs = run_halving(
+        trials,
+        {"n_estimators": 10, "random_state": 0},
+        _fit_transform_features,
+        n_cpus=2,
+        eta=2,
+        min_fraction=0.25,
+    )
+
+    # 4 trials on 50 rows, the best 2 on 100 rows, then the best one on all the rows
+    assert [(r["rung"], r["n_rows"]) for r in rungs] == [(0, 50)] * 4 + [(1, 100)] * 2
+    assert [r["max_depth"] for r in rungs if r["rung"] == 1] == [3, 12]
+    assert [r["max_depth"] for r in results] == [12]
+    assert set(results[0]) == {"max_depth", "max_tfidf_features", "mae", "r2"}